@@ -0,0 +1,173 @@
+from array import array
+from datetime import datetime
+from functools import lru_cache
+import math
+
+
+TIMELINE_DATE_FORMATS = ('%m/%d/%Y', '%B %Y', '%Y')
+PERCENTILES = (25, 50, 75, 90)
+
+@lru_cache(maxsize=4096)
+def parse_timeline_date(value):
+    """Parse the free-form dates used in timelines ("7/18/2022", "January 2022") into a date.
+    Cached because the same handful of dates repeats across every pixel."""
+    if not value:
+        return None
+    for date_format in TIMELINE_DATE_FORMATS:
+        try:
+            return datetime.strptime(value.strip(), date_format).date()
+        except ValueError:
+            continue
+    return None
+
+def new_rollup():
+    """Create the column arrays add_to_rollup fills in, one slot per pixel"""
+    return {
+        "pixel_numbers": [],
+        "generation": [],
+        "state": [],
+        "emissions": array('d'),
+        "distance": array('d'),
+        "emission_steps": {},
+        "distance_steps": {},
+        "undated_emissions": 0.0
+    }
+
+def add_to_rollup(rollup, pixel, pixel_timeline):
+    """Append a pixel and its timeline (or None) to the rollup columns"""
+    rollup["pixel_numbers"].append(pixel.pixel_number)
+    rollup["generation"].append(pixel.generation)
+    rollup["state"].append(pixel.state)
+    rollup["emissions"].append(pixel_timeline.total_emissions if pixel_timeline is not None else 0)
+    rollup["distance"].append(pixel_timeline.total_distance if pixel_timeline is not None else 0)
+    add_dated_steps(rollup, pixel_timeline)
+
+def add_dated_steps(rollup, pixel_timeline):
+    """Add the steps of a timeline (or None) to the fleet-wide emissions and distance per date"""
+    if pixel_timeline is None:
+        return
+    for entry in pixel_timeline.steps:
+        date = parse_timeline_date(entry.date)
+        if date is None:
+            rollup["undated_emissions"] += entry.step_total
+            continue
+        rollup["emission_steps"][date] = rollup["emission_steps"].get(date, 0) + entry.step_total
+        rollup["distance_steps"][date] = rollup["distance_steps"].get(date, 0) + entry.distance
+
+def percentile(ordered, q, count=None):
+    """Linearly interpolated percentile of an already sorted sequence, as numpy.percentile does.
+    With count given, ordered only needs the two positions the percentile falls between."""
+    count = len(ordered) if count is None else count
+    position = (count - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, count - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+def percentile_positions(count):
+    """The positions in count sorted values that the minimum, the maximum and PERCENTILES need"""
+    positions = {0, count - 1}
+    for q in PERCENTILES:
+        position = (count - 1) * q / 100
+        positions.update((int(position), min(int(position) + 1, count - 1)))
+    return positions
+
+def summarize_ordered(count, ordered):
+    """Total, mean, extremes and percentiles of count values given in ascending order. The values
+    are read once and only the ones at percentile_positions are kept, so they can come straight
+    from a sorted query."""
+    if not count:
+        return {"count": 0, "total": 0.0, "mean": None, "min": None, "max": None,
+                **{f"p{q}": None for q in PERCENTILES}}
+    wanted = percentile_positions(count)
+    picked = {}
+    
+    def pick(values):
+        for position, value in enumerate(values):
+            if position in wanted:
+                picked[position] = value
+            yield value
+    
+    total = math.fsum(pick(ordered))
+    return {
+        "count": count,
+        "total": round(total, 6),
+        "mean": round(total / count, 6),
+        "min": round(picked[0], 6),
+        "max": round(picked[count - 1], 6),
+        **{f"p{q}": round(percentile(picked, q, count), 6) for q in PERCENTILES}
+    }
+
+def summarize_column(column, indices=None):
+    """Total, mean, extremes and percentiles of a column, optionally over a subset of its rows"""
+    values = column if indices is None else array('d', (column[i] for i in indices))
+    return summarize_ordered(len(values), sorted(values))
+
+def summarize_groups(rollup, keys):
+    """Summarize emissions and distance per distinct key, given one key per rollup row"""
+    groups = {}
+    for index, key in enumerate(keys):
+        if key is not None:
+            groups.setdefault(key, []).append(index)
+    return {
+        str(key): {
+            "emissions": summarize_column(rollup["emissions"], indices),
+            "distance": summarize_column(rollup["distance"], indices)
+        }
+        for key, indices in sorted(groups.items())
+    }
+
+def create_cumulative_series(rollup):
+    """Fleet-wide emissions and distance per date, sorted by date with running totals"""
+    series = []
+    cumulative_emissions = 0.0
+    cumulative_distance = 0.0
+    for date in sorted(rollup["emission_steps"]):
+        cumulative_emissions += rollup["emission_steps"][date]
+        cumulative_distance += rollup["distance_steps"][date]
+        series.append({
+            "date": date.isoformat(),
+            "emissions": round(float(rollup["emission_steps"][date]), 6),
+            "cumulative_emissions": round(cumulative_emissions, 6),
+            "distance": round(float(rollup["distance_steps"][date]), 6),
+            "cumulative_distance": round(cumulative_distance, 6)
+        })
+    return series
+
+def assemble_aggregates(fleet, by_generation, by_state, by_reconfiguration, rollup):
+    """The aggregates.json data from the emissions and distance summaries of the fleet and of every
+    group, plus the dated series of the rollup"""
+    return {
+        "fleet": fleet,
+        "by_generation": by_generation,
+        "by_state": by_state,
+        "by_reconfiguration": by_reconfiguration,
+        "emissions_over_time": create_cumulative_series(rollup),
+        "undated_emissions": round(rollup["undated_emissions"], 6)
+    }
+
+def create_aggregates_from_rollup(rollup, pixel_networks):
+    """Compute the aggregates.json statistics from filled rollup columns and the reconfiguration networks"""
+    # Duplicate pixel numbers resolve to their last row, like the per-pixel files do
+    positions = {pixel_number: index for index, pixel_number in enumerate(rollup["pixel_numbers"])}
+    by_reconfiguration = {}
+    for number, network in sorted(pixel_networks.items()):
+        indices = sorted({positions[pixel_number] for pixel_number in network if pixel_number in positions})
+        by_reconfiguration[str(number)] = {
+            "emissions": summarize_column(rollup["emissions"], indices),
+            "distance": summarize_column(rollup["distance"], indices)
+        }
+    
+    fleet = {
+        "emissions": summarize_column(rollup["emissions"]),
+        "distance": summarize_column(rollup["distance"])
+    }
+    return assemble_aggregates(fleet, summarize_groups(rollup, rollup["generation"]),
+                               summarize_groups(rollup, rollup["state"]), by_reconfiguration, rollup)
+
+def create_aggregates(records, pixel_networks):
+    """Roll (pixel, timeline) records up per generation, state and reconfiguration, plus a dated
+    fleet-wide cumulative series, so dashboards render without touching per-pixel data"""
+    rollup = new_rollup()
+    for pixel, pixel_timeline in records:
+        add_to_rollup(rollup, pixel, pixel_timeline)
+    return create_aggregates_from_rollup(rollup, pixel_networks)
@@ -0,0 +1,143 @@
+import json
+import os
+import shutil
+
+from bank_files import hash_file, hash_text, serialize_json, write_json_atomic, write_text_atomic
+from build_instrumentation import count_event
+
+
+# Trees under public/data covered by the content-addressed asset manifest
+ASSET_ROOTS = ('bank', 'previews', 'models', 'media')
+HASHED_NAME_LENGTH = 12
+ASSET_HASHES_VERSION = 1
+# Clients may still hold an older manifest, so the hashed files of the last few versions are kept
+HASHED_VERSIONS_KEPT = 3
+HASHED_VERSIONS_FILE = '.versions.json'
+
+def load_asset_hashes(hashes_path):
+    """Read the [size, modification time, hash] of every asset hashed by a previous build, or an empty
+    mapping if there is no usable cache"""
+    try:
+        with open(hashes_path, 'r') as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(cache, dict) or cache.get("version") != ASSET_HASHES_VERSION:
+        return {}
+    return cache.get("files", {})
+
+def hash_assets(data_path, relative_paths, known_hashes):
+    """Return [size, modification time, hash] for every asset, reading only the assets whose size or
+    modification time differ from known_hashes; the models and media trees rarely change"""
+    asset_hashes = {}
+    for relative_path in relative_paths:
+        stat = os.stat(f'{data_path}/{relative_path}')
+        known = known_hashes.get(relative_path)
+        if known is not None and known[:2] == [stat.st_size, stat.st_mtime_ns]:
+            asset_hashes[relative_path] = known
+            continue
+        asset_hashes[relative_path] = [stat.st_size, stat.st_mtime_ns, hash_file(f'{data_path}/{relative_path}')]
+        count_event('assets_hashed')
+    return asset_hashes
+
+def hashed_filename(relative_path, digest):
+    """Insert the start of the content hash before the extension: pixel_0042.json becomes
+    pixel_0042.<hash>.json"""
+    directory, filename = os.path.split(relative_path)
+    stem, extension = os.path.splitext(filename)
+    return os.path.join(directory, f"{stem}.{digest[:HASHED_NAME_LENGTH]}{extension}").replace(os.sep, '/')
+
+def list_assets(data_path, roots=ASSET_ROOTS):
+    """Return the sorted paths, relative to data_path, of every asset in the given trees, leaving out
+    hidden files and the .gz and .br sidecars of the bank"""
+    relative_paths = []
+    for root in roots:
+        for directory, _, filenames in os.walk(f'{data_path}/{root}'):
+            for filename in filenames:
+                if filename.startswith('.') or filename.endswith(('.json.gz', '.json.br')):
+                    continue
+                relative_paths.append(os.path.relpath(os.path.join(directory, filename), data_path).replace(os.sep, '/'))
+    return sorted(relative_paths)
+
+def create_asset_manifest(asset_hashes, hashed=False):
+    """Map every logical asset path to its content hash and size, plus its hashed filename if hashed
+    files are placed, and a version token that changes whenever the bytes of any asset change"""
+    files = {}
+    for relative_path, (size, _, digest) in sorted(asset_hashes.items()):
+        files[relative_path] = {"hash": digest, "size": size}
+        if hashed:
+            files[relative_path]["file"] = hashed_filename(relative_path, digest)
+    version = hash_text(json.dumps([[path, entry["hash"]] for path, entry in files.items()]))
+    return {"version": version[:16], "files": files}
+
+def link_or_copy(source, destination, link=True):
+    """Hard link source to destination, or copy it when linking is not requested or not possible"""
+    if link:
+        try:
+            os.link(source, destination)
+            return
+        except OSError:
+            pass
+    shutil.copy2(source, destination)
+
+def write_hashed_assets(data_path, manifest, hashed_path):
+    """Place every asset (and its sidecars) under its hashed filename in hashed_path, so it can be
+    served with immutable cache headers. Existing hashed files are never rewritten."""
+    for relative_path, entry in manifest["files"].items():
+        # Only the bank is always replaced by a rename, never rewritten in place; a tool that rewrites
+        # a model or media file in place would change a linked hashed copy too, so those are copied
+        link = relative_path.startswith('bank/')
+        for suffix in ('', '.gz', '.br'):
+            source = f'{data_path}/{relative_path}{suffix}'
+            destination = f'{hashed_path}/{entry["file"]}{suffix}'
+            if os.path.exists(destination) or (suffix and not os.path.exists(source)):
+                continue
+            os.makedirs(os.path.dirname(destination), exist_ok=True)
+            link_or_copy(source, destination, link)
+            count_event('hashed_assets_written')
+    prune_hashed_assets(manifest, hashed_path)
+
+def prune_hashed_assets(manifest, hashed_path, kept=HASHED_VERSIONS_KEPT):
+    """Record the hashed files of this manifest version in hashed_path and remove the ones that only
+    versions older than the last kept ones use. Files no recorded version placed are left alone."""
+    versions_path = f'{hashed_path}/{HASHED_VERSIONS_FILE}'
+    try:
+        with open(versions_path, 'r') as f:
+            versions = json.load(f)["versions"]
+    except (OSError, ValueError, KeyError, TypeError):
+        versions = []
+    current = {"version": manifest["version"], "files": sorted(entry["file"] for entry in manifest["files"].values())}
+    updated = [current] + [version for version in versions if version["version"] != current["version"]]
+    if updated == versions:
+        return
+    
+    kept_files = {filename for version in updated[:kept] for filename in version["files"]}
+    for version in updated[kept:]:
+        for filename in version["files"]:
+            if filename in kept_files:
+                continue
+            for suffix in ('', '.gz', '.br'):
+                if os.path.exists(f'{hashed_path}/{filename}{suffix}'):
+                    os.remove(f'{hashed_path}/{filename}{suffix}')
+                    count_event('hashed_assets_removed')
+    write_json_atomic(versions_path, {"versions": updated[:kept]}, 'compact')
+
+def update_asset_manifest(data_path, manifest_path, output_format='pretty', hashed_path=None, hashes_path=None):
+    """Rewrite the asset manifest if any asset changed and optionally place the hashed files, pruning
+    the ones no recent manifest names. With hashes_path, asset hashes are kept there between builds
+    so unchanged assets are not read again."""
+    known_hashes = load_asset_hashes(hashes_path) if hashes_path else {}
+    asset_hashes = hash_assets(data_path, list_assets(data_path), known_hashes)
+    if hashes_path and asset_hashes != known_hashes:
+        write_json_atomic(hashes_path, {"version": ASSET_HASHES_VERSION, "files": asset_hashes}, 'compact')
+    manifest = create_asset_manifest(asset_hashes, hashed=bool(hashed_path))
+    text = serialize_json(manifest, output_format)
+    previous = None
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r') as f:
+            previous = f.read()
+    if text != previous:
+        write_text_atomic(manifest_path, text)
+        print(f"Asset manifest version {manifest['version']} ({len(manifest['files'])} files)")
+    if hashed_path:
+        write_hashed_assets(data_path, manifest, hashed_path)
@@ -0,0 +1,273 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+import gzip
+import hashlib
+import json
+import os
+import re
+import threading
+
+try:
+    import brotli
+except ImportError:  # Optional, only needed for the .br sidecars of --precompress
+    brotli = None
+
+from build_instrumentation import count_event, record_write
+
+
+JSON_FORMATS = {
+    'pretty': {'indent': 2},
+    'compact': {'separators': (',', ':')}
+}
+
+def hash_text(text):
+    """Return the SHA-256 hex digest of a string"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def hash_file(path):
+    """Return the SHA-256 hex digest of a file's bytes, reading large files in chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(partial(f.read, 1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def file_stat(path):
+    """The size, modification time and inode of a file; replacing or rewriting it changes them"""
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns, stat.st_ino]
+
+def verify_file(path, digest, recorded_stat):
+    """Return the current file_stat of path if the file still holds the bytes with the given digest,
+    or None. A file whose stat matches recorded_stat is trusted without reading it."""
+    try:
+        current = file_stat(path)
+    except FileNotFoundError:
+        return None
+    if current == recorded_stat or hash_file(path) == digest:
+        return current
+    return None
+
+def serialize_json(data, output_format='pretty'):
+    """Serialize data exactly the way files in the bank are written"""
+    return json.dumps(data, **JSON_FORMATS[output_format])
+
+def temporary_path(path):
+    """Return a sibling path unique to this process and thread for writing path atomically"""
+    return f'{path}.tmp-{os.getpid()}-{threading.get_ident()}'
+
+def write_bytes_atomic(path, payload):
+    """Write bytes to a temporary sibling file and rename it over path, so readers never see
+    a half-written file even if the build crashes midway"""
+    tmp_path = temporary_path(path)
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(payload)
+        os.replace(tmp_path, path)
+        record_write(len(payload))
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def write_text_atomic(path, text):
+    """Atomically write a string to path"""
+    write_bytes_atomic(path, text.encode('utf-8'))
+
+def write_json_atomic(path, data, output_format='pretty'):
+    """Serialize data for the bank, write it atomically and return the digest of the written text"""
+    text = serialize_json(data, output_format)
+    write_text_atomic(path, text)
+    return hash_text(text)
+
+def _write_json_job(job, output_format='pretty'):
+    path, data = job
+    return write_json_atomic(path, data, output_format)
+
+def write_json_files(jobs, workers=1, executor='thread', output_format='pretty'):
+    """Write a list of (path, data) pairs atomically with a pool of thread or process workers.
+
+    Each file only depends on its own data, so the output is the same for any worker count.
+    Returns the digests of the written files in the order of jobs.
+    """
+    write_job = partial(_write_json_job, output_format=output_format)
+    if workers <= 1 or len(jobs) <= 1:
+        return [write_job(job) for job in jobs]
+    
+    if executor == 'process':
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            digests = list(pool.map(write_job, jobs, chunksize=max(1, len(jobs) // (workers * 4))))
+        # Worker processes record into their own copy of the instrumentation, so count here
+        for path, _ in jobs:
+            record_write(os.path.getsize(path))
+        return digests
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(write_job, jobs))
+
+def list_bank_files(output_base_path):
+    """Return the sorted paths, relative to the bank, of every JSON file in the bank"""
+    relative_paths = []
+    for directory, _, filenames in os.walk(output_base_path):
+        for filename in filenames:
+            if filename.endswith('.json'):
+                relative_paths.append(os.path.relpath(os.path.join(directory, filename), output_base_path))
+    return sorted(relative_paths)
+
+def snapshot_sizes(output_base_path):
+    """Return the size in bytes of every JSON file currently in the bank"""
+    return {
+        relative_path: os.path.getsize(os.path.join(output_base_path, relative_path))
+        for relative_path in list_bank_files(output_base_path)
+    }
+
+def sidecar_compressors():
+    """Return the (suffix, compress) pairs of the precompressed variants we can produce"""
+    compressors = [('.gz', lambda raw: gzip.compress(raw, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        compressors.append(('.br', lambda raw: brotli.compress(raw, quality=11)))
+    return compressors
+
+def remove_stale_sidecars(output_base_path):
+    """Remove .gz and .br sidecars whose JSON file is gone or was rewritten after them, so the
+    static host never serves precompressed bytes that no longer match the JSON"""
+    for directory, _, filenames in os.walk(output_base_path):
+        for filename in filenames:
+            if not filename.endswith(('.json.gz', '.json.br')):
+                continue
+            sidecar = os.path.join(directory, filename)
+            source = sidecar[:-3]
+            if not os.path.exists(source) or os.stat(source).st_mtime_ns > os.stat(sidecar).st_mtime_ns:
+                os.remove(sidecar)
+                count_event('stale_sidecars_removed')
+
+def write_compressed_sidecars(output_base_path):
+    """Write .gz and .br sidecars next to every JSON file in the bank that does not have an
+    up-to-date one yet"""
+    if brotli is None:
+        print("brotli is not installed; skipping .br sidecars (pip install brotli)")
+    remove_stale_sidecars(output_base_path)
+    compressors = sidecar_compressors()
+    
+    for relative_path in list_bank_files(output_base_path):
+        path = os.path.join(output_base_path, relative_path)
+        raw = None
+        for suffix, compress in compressors:
+            if os.path.exists(path + suffix):
+                count_event('sidecars_up_to_date')
+                continue
+            if raw is None:
+                with open(path, 'rb') as f:
+                    raw = f.read()
+            write_bytes_atomic(path + suffix, compress(raw))
+
+def print_size_report(sizes_before, output_base_path):
+    """Print the bank size before and after this build, raw and precompressed"""
+    def group_of(relative_path):
+        if re.fullmatch(r'pixel/pixel_\d+\.json', relative_path.replace(os.sep, '/')):
+            return 'pixel/pixel_XXXX.json'
+        return relative_path.replace(os.sep, '/')
+    
+    def sidecar_size(path, suffix):
+        return os.path.getsize(path + suffix) if os.path.exists(path + suffix) else None
+    
+    groups = {}
+    for relative_path in list_bank_files(output_base_path):
+        path = os.path.join(output_base_path, relative_path)
+        totals = groups.setdefault(group_of(relative_path), {'before': 0, 'after': 0, '.gz': 0, '.br': 0})
+        totals['after'] += os.path.getsize(path)
+        for suffix in ('.gz', '.br'):
+            size = sidecar_size(path, suffix)
+            if size is None or totals[suffix] is None:
+                totals[suffix] = None
+            else:
+                totals[suffix] += size
+    for relative_path, size in sizes_before.items():
+        group = groups.get(group_of(relative_path))
+        if group is not None:
+            group['before'] += size
+    
+    overall = {'before': 0, 'after': 0, '.gz': 0, '.br': 0}
+    for totals in groups.values():
+        for column in overall:
+            overall[column] = None if overall[column] is None or totals[column] is None else overall[column] + totals[column]
+    
+    def cell(value):
+        return f"{value:>12,}" if value is not None else f"{'-':>12}"
+    
+    print(f"{'Size report (bytes)':<36}{'before':>12}{'after':>12}{'gzip':>12}{'brotli':>12}")
+    for name, totals in sorted(groups.items()) + [('total', overall)]:
+        print(f"{name:<36}" + ''.join(cell(totals[column]) for column in ('before', 'after', '.gz', '.br')))
+
+class StreamedArray:
+    """A JSON array whose items are only produced while write_json_chunked writes it"""
+    def __init__(self, items):
+        self.items = items
+
+class StreamedObject:
+    """A JSON object whose (key, value) pairs are only produced while write_json_chunked writes it"""
+    def __init__(self, items):
+        self.items = items
+
+def holds_streamed(data):
+    """Whether data is, or has somewhere inside it, a StreamedArray or StreamedObject"""
+    if isinstance(data, (StreamedArray, StreamedObject)):
+        return True
+    if isinstance(data, dict):
+        return any(holds_streamed(value) for value in data.values())
+    if isinstance(data, list):
+        return any(holds_streamed(value) for value in data)
+    return False
+
+def iter_json_chunks(data, output_format='pretty', level=0):
+    """Encode data exactly like serialize_json, in chunks. Streamed values and the dicts and lists
+    holding them are encoded item by item as the items are produced; anything else at once."""
+    indent = JSON_FORMATS[output_format].get('indent')
+    if not isinstance(data, (dict, list, StreamedArray, StreamedObject)):
+        yield json.dumps(data)
+        return
+    if not holds_streamed(data):
+        text = serialize_json(data, output_format)
+        yield text.replace('\n', '\n' + ' ' * (indent * level)) if indent and level else text
+        return
+    
+    if isinstance(data, (dict, StreamedObject)):
+        brackets, items = '{}', data.items() if isinstance(data, dict) else data.items
+    else:
+        brackets, items = '[]', ((None, value) for value in (data if isinstance(data, list) else data.items))
+    yield brackets[0]
+    empty = True
+    for key, value in items:
+        prefix = '' if empty else ','
+        if indent:
+            prefix += '\n' + ' ' * (indent * (level + 1))
+        if key is not None:
+            prefix += json.dumps(key) + (': ' if indent else ':')
+        yield prefix
+        yield from iter_json_chunks(value, output_format, level + 1)
+        empty = False
+    if indent and not empty:
+        yield '\n' + ' ' * (indent * level)
+    yield brackets[1]
+
+def write_json_chunked(path, data, output_format='pretty'):
+    """Atomically write data exactly like write_json_atomic, but encode it chunk by chunk straight
+    into the file instead of building the whole text in memory first"""
+    tmp_path = temporary_path(path)
+    try:
+        with open(tmp_path, 'w', encoding='utf-8', newline='') as f:
+            buffered = []
+            size = 0
+            for chunk in iter_json_chunks(data, output_format):
+                buffered.append(chunk)
+                size += len(chunk)
+                if size >= 1 << 16:
+                    f.write(''.join(buffered))
+                    buffered = []
+                    size = 0
+            f.write(''.join(buffered))
+        os.replace(tmp_path, path)
+        record_write(os.path.getsize(path))
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
@@ -0,0 +1,166 @@
+from array import array
+import math
+
+
+# Route geometry: great-circle arcs between the consecutive locations of every pixel journey
+EARTH_RADIUS_KM = 6371.0088
+ROUTE_STEP_DEGREES = 1.0  # at most one degree of arc between densified points
+ROUTE_SCALE = 10000  # coordinates are quantized to 1e-4 degrees, about 11 m
+# Transport distances are along roads and flight paths, so they may exceed the great-circle distance
+# but should not fall below it; flag legs outside these bounds
+DISTANCE_CHECK_TOLERANCE = 0.05
+DISTANCE_CHECK_DETOUR = 2.0
+DISTANCE_CHECK_SLACK_KM = 50
+
+def unit_vector(latitude, longitude):
+    phi = math.radians(latitude)
+    lam = math.radians(longitude)
+    return (math.cos(phi) * math.cos(lam), math.cos(phi) * math.sin(lam), math.sin(phi))
+
+def great_circle_km(start, end):
+    """Haversine distance in kilometers between two (latitude, longitude) points"""
+    phi1, phi2 = math.radians(start[0]), math.radians(end[0])
+    half_dphi = (phi2 - phi1) / 2
+    half_dlam = math.radians(end[1] - start[1]) / 2
+    a = math.sin(half_dphi) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(half_dlam) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+def densify_great_circle(start, end):
+    """Points along the great circle from start to end as (longitude, latitude), spherically
+    interpolated at most ROUTE_STEP_DEGREES apart"""
+    a = unit_vector(*start)
+    b = unit_vector(*end)
+    omega = math.acos(max(-1.0, min(1.0, sum(x * y for x, y in zip(a, b)))))
+    segments = max(1, math.ceil(math.degrees(omega) / ROUTE_STEP_DEGREES))
+    sin_omega = math.sin(omega)
+    points = []
+    for i in range(segments + 1):
+        t = i / segments
+        if sin_omega < 1e-12:
+            x, y, z = a
+        else:
+            wa = math.sin((1 - t) * omega) / sin_omega
+            wb = math.sin(t * omega) / sin_omega
+            x, y, z = (wa * a[k] + wb * b[k] for k in range(3))
+        points.append((math.degrees(math.atan2(y, x)), math.degrees(math.atan2(z, math.hypot(x, y)))))
+    # Keep the endpoints exact
+    points[0] = (start[1], start[0])
+    points[-1] = (end[1], end[0])
+    return points
+
+def encode_polyline(points):
+    """Quantize (longitude, latitude) points and delta-encode them into one flat list of integers:
+    the first point absolute, every following point relative to the previous one"""
+    encoded = []
+    previous_lon = previous_lat = 0
+    for longitude, latitude in points:
+        lon = round(longitude * ROUTE_SCALE)
+        lat = round(latitude * ROUTE_SCALE)
+        encoded.extend((lon - previous_lon, lat - previous_lat))
+        previous_lon, previous_lat = lon, lat
+    return encoded
+
+def new_routes():
+    """Accumulator of unique legs, the legs of every pixel and assembly, and the distance checks.
+    The legs of pixel i are pixel_legs[pixel_offsets[i]:pixel_offsets[i + 1]], kept in compact arrays."""
+    return {"legs": {}, "pixel_numbers": array('q'), "pixel_offsets": array('q', [0]), "pixel_legs": array('q'),
+            "assemblies": {}, "checks": {}}
+
+def add_pixel_legs(routes, pixel_timeline):
+    """Add the legs between the consecutive located steps of a pixel timeline to the unique legs,
+    the assemblies and the distance checks, and return the indices of the legs with points"""
+    legs = []
+    previous = None
+    for entry in pixel_timeline.steps:
+        location = entry.location
+        if location.latitude is None or location.longitude is None:
+            continue
+        if previous is not None:
+            start = (previous.latitude, previous.longitude)
+            end = (location.latitude, location.longitude)
+            key = (start, end)
+            if key not in routes["legs"]:
+                # Legs are shared by many pixels, so each unique leg is measured and densified once
+                distance = great_circle_km(start, end)
+                routes["legs"][key] = {
+                    "index": len(routes["legs"]),
+                    "from": previous.name,
+                    "to": location.name,
+                    "great_circle_km": distance,
+                    "points": encode_polyline(densify_great_circle(start, end)) if distance > 0 else None
+                }
+            leg = routes["legs"][key]
+            if leg["points"] is not None:
+                legs.append(leg["index"])
+                routes["assemblies"].setdefault(entry.reconfiguration_number, set()).add(leg["index"])
+            # One distance is recorded per reconfiguration, so it is checked against all of its incoming legs
+            incoming = routes["checks"].setdefault((entry.reconfiguration_number, entry.distance), {})
+            incoming[leg["index"]] = incoming.get(leg["index"], 0) + 1
+        previous = location
+    return legs
+
+def add_pixel_routes(routes, pixel_timeline):
+    """Add the legs of a pixel timeline and record them as the legs of its pixel"""
+    routes["pixel_numbers"].append(pixel_timeline.pixel_number)
+    routes["pixel_legs"].extend(add_pixel_legs(routes, pixel_timeline))
+    routes["pixel_offsets"].append(len(routes["pixel_legs"]))
+
+def distance_disagrees(recorded, computed):
+    return (recorded < computed * (1 - DISTANCE_CHECK_TOLERANCE)
+            or recorded > computed * DISTANCE_CHECK_DETOUR + DISTANCE_CHECK_SLACK_KM)
+
+def create_routes_from_table(routes, pixels=None):
+    """The routes.json data: every leg (without points if both ends are the same location), the legs
+    per pixel and the legs its pixels arrived by per assembly, and the reconfigurations whose recorded
+    transport distance disagrees with the great-circle distance of every leg their pixels arrived by.
+    pixels, if given, maps serials to leg indices in place of the legs add_pixel_routes recorded."""
+    legs = sorted(routes["legs"].values(), key=lambda leg: leg["index"])
+    distance_checks = []
+    for (reconfiguration_number, recorded), incoming in routes["checks"].items():
+        # Pixels of one assembly may arrive from different places; the recorded distance only needs
+        # to match one of them
+        if all(distance_disagrees(recorded, legs[index]["great_circle_km"]) for index in incoming):
+            distance_checks.append({
+                "reconfiguration_number": reconfiguration_number,
+                "to": legs[next(iter(incoming))]["to"],
+                "recorded_km": recorded,
+                "incoming": [
+                    {
+                        "from": legs[index]["from"],
+                        "great_circle_km": round(legs[index]["great_circle_km"], 1),
+                        "pixels": count
+                    }
+                    for index, count in sorted(incoming.items())
+                ]
+            })
+    distance_checks.sort(key=lambda check: (check["reconfiguration_number"], check["recorded_km"]))
+    
+    if pixels is None:
+        # Like the pixel files, a duplicate pixel number keeps its first position and its last legs
+        pixels = {}
+        offsets = routes["pixel_offsets"]
+        for i, pixel_number in enumerate(routes["pixel_numbers"]):
+            pixels[f"{pixel_number:04d}"] = routes["pixel_legs"][offsets[i]:offsets[i + 1]].tolist()
+    
+    return {
+        "scale": ROUTE_SCALE,
+        "legs": [
+            {
+                "from": leg["from"],
+                "to": leg["to"],
+                "great_circle_km": round(leg["great_circle_km"], 1),
+                "points": leg["points"]
+            }
+            for leg in legs
+        ],
+        "pixels": pixels,
+        "assemblies": {str(number): sorted(indices) for number, indices in sorted(routes["assemblies"].items())},
+        "distance_checks": distance_checks
+    }
+
+def create_routes(timeline_data):
+    """Precompute the great-circle journey geometry of every pixel and assembly for the map views"""
+    routes = new_routes()
+    for pixel_timeline in timeline_data["pixels"]:
+        add_pixel_routes(routes, pixel_timeline)
+    return create_routes_from_table(routes)
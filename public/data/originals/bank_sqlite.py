@@ -0,0 +1,232 @@
+import os
+import sqlite3
+
+from bank_aggregates import parse_timeline_date
+from bank_files import hash_file, temporary_path
+from build_instrumentation import count_event, record_write
+
+
+SQLITE_SCHEMA = """
+CREATE TABLE pixels (
+    pixel_number INTEGER PRIMARY KEY,
+    serial TEXT NOT NULL,
+    generation INTEGER,
+    generation_description TEXT,
+    state INTEGER,
+    state_description TEXT,
+    fc REAL,
+    weight REAL,
+    concrete_mix TEXT,
+    fiber_type TEXT,
+    fiber_dosage TEXT,
+    date_of_manufacture TEXT,
+    number_of_reconfigurations INTEGER,
+    gif INTEGER NOT NULL,
+    notes TEXT,
+    total_emissions REAL NOT NULL,
+    total_distance REAL NOT NULL
+);
+CREATE TABLE reconfigurations (
+    number INTEGER PRIMARY KEY,
+    serial TEXT NOT NULL,
+    name TEXT,
+    description TEXT,
+    date TEXT,
+    generation_name TEXT,
+    scale TEXT,
+    location_name TEXT,
+    latitude REAL,
+    longitude REAL,
+    pixel_weight REAL,
+    a1_a3_coefficient REAL,
+    a1_a3_emissions REAL,
+    transport_distance REAL,
+    transport_type TEXT,
+    transport_coefficient REAL,
+    transport_emissions REAL,
+    total_emissions REAL
+);
+CREATE TABLE pixel_reconfigurations (
+    pixel_number INTEGER NOT NULL,
+    reconfiguration_number INTEGER NOT NULL,
+    PRIMARY KEY (pixel_number, reconfiguration_number)
+) WITHOUT ROWID;
+CREATE TABLE timeline_steps (
+    pixel_number INTEGER NOT NULL,
+    step INTEGER NOT NULL,
+    reconfiguration_number INTEGER NOT NULL,
+    name TEXT,
+    date TEXT,
+    iso_date TEXT,
+    location_name TEXT,
+    latitude REAL,
+    longitude REAL,
+    a1_a3 REAL,
+    transport_emissions REAL,
+    step_total REAL,
+    running_total REAL,
+    transport_type TEXT,
+    distance REAL,
+    cumulative_distance REAL,
+    description TEXT,
+    PRIMARY KEY (pixel_number, step)
+);
+"""
+# Created after the bulk insert, which is faster than maintaining them row by row
+SQLITE_INDEXES = (
+    'CREATE INDEX pixels_state ON pixels (state)',
+    'CREATE INDEX pixels_generation ON pixels (generation)',
+    'CREATE INDEX pixel_reconfigurations_reconfiguration ON pixel_reconfigurations (reconfiguration_number)',
+    'CREATE INDEX timeline_steps_reconfiguration ON timeline_steps (reconfiguration_number)',
+    'CREATE INDEX timeline_steps_iso_date ON timeline_steps (iso_date)'
+)
+
+def open_sqlite_export(path):
+    """Create an empty database next to path and start the single transaction that fills it"""
+    tmp_path = temporary_path(path)
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    connection = sqlite3.connect(tmp_path, isolation_level=None)
+    # The file only replaces path once complete, so it needs no journal
+    connection.execute('PRAGMA journal_mode = OFF')
+    connection.execute('PRAGMA synchronous = OFF')
+    connection.executescript(SQLITE_SCHEMA)
+    connection.execute('BEGIN')
+    return {"connection": connection, "path": path, "tmp_path": tmp_path}
+
+def insert_pixel_record(connection, pixel, pixel_timeline):
+    """Insert a pixel and its timeline steps; a later row with the same pixel number replaces the
+    earlier one, like it does for the pixel files"""
+    if pixel.pixel_number is None:
+        return
+    # Ask the database rather than remembering every pixel number, so the streaming build stays small
+    if connection.execute('SELECT 1 FROM pixels WHERE pixel_number = ?', (pixel.pixel_number,)).fetchone():
+        connection.execute('DELETE FROM timeline_steps WHERE pixel_number = ?', (pixel.pixel_number,))
+    
+    connection.execute(f"INSERT OR REPLACE INTO pixels VALUES ({', '.join('?' * 17)})", (
+        pixel.pixel_number, f"{pixel.pixel_number:04d}", pixel.generation, pixel.generation_description,
+        pixel.state, pixel.state_description, pixel.fc, pixel.weight, pixel.concrete_mix, pixel.fiber_type,
+        pixel.fiber_dosage, pixel.date_of_manufacture, pixel.number_of_reconfigurations, pixel.gif, pixel.notes,
+        pixel_timeline.total_emissions if pixel_timeline is not None else 0,
+        pixel_timeline.total_distance if pixel_timeline is not None else 0
+    ))
+    if pixel_timeline is None:
+        return
+    steps = []
+    for entry in pixel_timeline.steps:
+        iso_date = parse_timeline_date(entry.date)
+        steps.append((
+            pixel.pixel_number, entry.step, entry.reconfiguration_number, entry.name, entry.date,
+            iso_date.isoformat() if iso_date else None, entry.location.name, entry.location.latitude,
+            entry.location.longitude, entry.a1_a3, entry.transport_emissions, entry.step_total,
+            entry.running_total, entry.transport_type, entry.distance, entry.cumulative_distance, entry.description
+        ))
+    connection.executemany(f"INSERT INTO timeline_steps VALUES ({', '.join('?' * 17)})", steps)
+
+def stream_sqlite(records, export):
+    """Pass (pixel, timeline) records through unchanged while inserting them into the export"""
+    for pixel, pixel_timeline in records:
+        insert_pixel_record(export["connection"], pixel, pixel_timeline)
+        yield pixel, pixel_timeline
+
+def network_memberships(pixel_networks):
+    """The (pixel number, reconfiguration number) pairs of the networks, in the order they are exported"""
+    for number, network in sorted(pixel_networks.items()):
+        for pixel_number in network:
+            yield pixel_number, number
+
+def insert_reconfigurations(connection, carbon_locations_data, memberships):
+    """Insert the reconfigurations and the (pixel number, reconfiguration number) pairs of their networks"""
+    connection.executemany(f"INSERT INTO reconfigurations VALUES ({', '.join('?' * 18)})", [
+        (
+            reconfiguration["number"], reconfiguration["serial"], reconfiguration["name"],
+            reconfiguration["description"], reconfiguration["date"], reconfiguration["generation_name"],
+            reconfiguration["scale"], reconfiguration["location"]["name"],
+            reconfiguration["location"]["coordinates"]["latitude"],
+            reconfiguration["location"]["coordinates"]["longitude"], reconfiguration["pixel_weight"],
+            reconfiguration["coefficient"], reconfiguration["a1_a3_emissions"],
+            reconfiguration["transport"]["distance"], reconfiguration["transport"]["type"],
+            reconfiguration["transport"]["coefficient"], reconfiguration["transport"]["emissions"],
+            reconfiguration["total_emissions"]
+        )
+        for reconfiguration in carbon_locations_data["reconfigurations"]
+    ])
+    connection.executemany('INSERT OR IGNORE INTO pixel_reconfigurations VALUES (?, ?)', memberships)
+
+def finish_sqlite_export(export, carbon_locations_data, memberships):
+    """Insert the reconfigurations and the (pixel number, reconfiguration number) pairs of their
+    networks, index and commit the database, and move it over the previous export unless their
+    bytes are the same"""
+    connection = export["connection"]
+    try:
+        insert_reconfigurations(connection, carbon_locations_data, memberships)
+        for statement in SQLITE_INDEXES:
+            connection.execute(statement)
+        connection.execute('COMMIT')
+        connection.close()
+    except BaseException:
+        discard_sqlite_export(export)
+        raise
+    
+    path, tmp_path = export["path"], export["tmp_path"]
+    if os.path.exists(path) and hash_file(path) == hash_file(tmp_path):
+        os.remove(tmp_path)
+        count_event('sqlite_export_unchanged')
+        return
+    record_write(os.path.getsize(tmp_path))
+    os.replace(tmp_path, path)
+
+def discard_sqlite_export(export):
+    export["connection"].close()
+    if os.path.exists(export["tmp_path"]):
+        os.remove(export["tmp_path"])
+
+def write_sqlite(path, records, carbon_locations_data, pixel_networks):
+    """Export (pixel, timeline) records, the reconfigurations, their networks and every timeline step
+    into one indexed SQLite database for ad-hoc joins, filled in bulk inside a single transaction"""
+    export = open_sqlite_export(path)
+    try:
+        for pixel, pixel_timeline in records:
+            insert_pixel_record(export["connection"], pixel, pixel_timeline)
+    except BaseException:
+        discard_sqlite_export(export)
+        raise
+    finish_sqlite_export(export, carbon_locations_data, network_memberships(pixel_networks))
+
+def replace_pixel_records(connection, records):
+    """Replace every pixel and timeline step of an export with the given (pixel, timeline) records"""
+    connection.execute('DELETE FROM timeline_steps')
+    connection.execute('DELETE FROM pixels')
+    for pixel, pixel_timeline in records:
+        insert_pixel_record(connection, pixel, pixel_timeline)
+
+def replace_pixels(connection, records, pixel_numbers):
+    """Replace the rows of the given pixel numbers with the last of their (pixel, timeline) records,
+    deleting the pixels that no longer have one"""
+    pixel_numbers = set(pixel_numbers)
+    latest = {pixel.pixel_number: (pixel, pixel_timeline)
+              for pixel, pixel_timeline in records if pixel.pixel_number in pixel_numbers}
+    for pixel_number in sorted(pixel_numbers):
+        connection.execute('DELETE FROM timeline_steps WHERE pixel_number = ?', (pixel_number,))
+        connection.execute('DELETE FROM pixels WHERE pixel_number = ?', (pixel_number,))
+        if pixel_number in latest:
+            insert_pixel_record(connection, *latest[pixel_number])
+
+def replace_reconfigurations(connection, carbon_locations_data, memberships):
+    """Replace the reconfigurations and networks of an export, leaving its pixels and timeline steps alone"""
+    connection.execute('DELETE FROM pixel_reconfigurations')
+    connection.execute('DELETE FROM reconfigurations')
+    insert_reconfigurations(connection, carbon_locations_data, memberships)
+
+def update_sqlite_export(path, updates):
+    """Run update(connection) for each of updates on the existing export at path in one transaction,
+    so a target build only rewrites the rows it owns instead of exporting everything again"""
+    connection = sqlite3.connect(path, isolation_level=None)
+    try:
+        connection.execute('BEGIN')
+        for update in updates:
+            update(connection)
+        connection.execute('COMMIT')
+    finally:
+        # Closing before the commit rolls the transaction back
+        connection.close()
@@ -0,0 +1,281 @@
+import argparse
+import csv
+from datetime import datetime
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import translate_to_json as build  # noqa: E402
+
+
+MASTER_LEADING_COLUMNS = [
+    'Pixel number', 'Generation', "fc'", 'Weight (kg)', 'Concrete mix', 'Fiber type', 'Fiber dosage',
+    'Date of manufacture', 'Number of reconfigurations at present', 'State'
+]
+MASTER_TRAILING_COLUMNS = ['GIF', 'notes']
+CARBON_COLUMNS = [
+    'Reconfiguration number', 'Reconfiguration name', 'Description', 'Generation name', 'Date', 'Scale',
+    'Location name', 'Location coordinates', 'Pixel weight (kg)', 'A1-A3 Coefficient',
+    'A1-A3 emissions (kgCO2e)', 'Transport distance (km)', 'Type of transport',
+    'Transport coefficient (kgCO2e/kg)', 'Carbon emissions (A4) (kgCO2e/pixel)',
+    'Total emissions per reconfiguration (kgCO2e/pixel)'
+]
+LOCATIONS = [
+    ("Cambridge, MA", "42.3666° N, 71.1057° W"),
+    ("Washington DC", "38.9072° N, 77.0369° W"),
+    ("Venice, Italy", "45.4408° N, 12.3155° E")
+]
+QUICK_SIZES = [1000, 10000]
+FULL_SIZES = [1000, 10000, 100000, 1000000]
+
+
+def reconfiguration_header(number):
+    """Header of a master.csv reconfiguration column, cycling through the shapes used in the real file"""
+    shapes = [
+        "Reconfiguration {n} (Synthetic Beam {n}) - Cambridge MA",
+        "Reconfiguration {n} (Synthetic Column {n})",
+        "Reconfiguration {n} (Synthetic Showcase {n}) ",
+        "Reconfiguration {n} - synthetic full-scale beam"
+    ]
+    return shapes[number % len(shapes)].format(n=number)
+
+def generate_inventory(directory, pixel_count, reconfiguration_count, seed=0):
+    """Write synthetic master.csv, carbon_location.csv and legend files with the real column layout"""
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+
+    with open(f'{directory}/generation_description.csv', 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['Generation number', 'Description'])
+        for generation in (1, 2, 3):
+            writer.writerow([generation, f"Synthetic generation {generation}"])
+
+    with open(f'{directory}/state_legend.csv', 'w', newline='') as file:
+        writer = csv.writer(file)
+        for state, description in enumerate(["Future fabrication", "Good", "Average", "Poor", "Retired"]):
+            writer.writerow([state, description])
+
+    with open(f'{directory}/carbon_location.csv', 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(CARBON_COLUMNS)
+        for number in range(1, reconfiguration_count + 1):
+            location_name, coordinates = LOCATIONS[number % len(LOCATIONS)]
+            a1_a3 = round(rng.uniform(0, 3), 4)
+            distance = rng.choice([0, 700, 6500, 12698])
+            transport = round(distance * 0.032 * 0.0052, 4)
+            writer.writerow([
+                number, f"Synthetic reconfiguration {number}", f"Synthetic description {number}. " * 4,
+                rng.randint(1, 3), f"{rng.randint(1, 12)}/{rng.randint(1, 28)}/{rng.randint(2022, 2030)}",
+                "1:2", location_name, coordinates, 6.04, 0.38, a1_a3, distance,
+                "truck" if distance else "N/A", 0.032 if distance else "", transport, round(a1_a3 + transport, 4)
+            ])
+
+    with open(f'{directory}/master.csv', 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(MASTER_LEADING_COLUMNS
+                        + [reconfiguration_header(n) for n in range(1, reconfiguration_count + 1)]
+                        + MASTER_TRAILING_COLUMNS)
+        for pixel_number in range(1, pixel_count + 1):
+            memberships = [''] * reconfiguration_count
+            for number in rng.sample(range(reconfiguration_count), min(reconfiguration_count, rng.randint(0, 4))):
+                memberships[number] = '1'
+            writer.writerow([
+                pixel_number, rng.randint(1, 3), 35, 3.2, "Rapidset high strength concrete mix ", "Glass fiber",
+                "3%", rng.choice([2022, 2023, 2025]), memberships.count('1'), rng.randint(0, 4)
+            ] + memberships + [rng.choice(['y', 'n', '']), ''])
+
+def input_sizes(directory):
+    """Size in bytes of each generated CSV file"""
+    return {filename: os.path.getsize(f'{directory}/{filename}') for filename in sorted(os.listdir(directory))}
+
+def measure(stages, name, trace_memory, function, *args):
+    """Run one stage, append its wall time and peak traced memory to stages and return its result.
+    The peak is counted above the memory already traced when the stage started, so the data earlier
+    stages keep alive is not charged to it."""
+    if trace_memory:
+        tracemalloc.reset_peak()
+        traced_at_start = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    result = function(*args)
+    seconds = time.perf_counter() - start
+    stage = {"name": name, "seconds": round(seconds, 6)}
+    if trace_memory:
+        stage["peak_bytes"] = tracemalloc.get_traced_memory()[1] - traced_at_start
+    stages.append(stage)
+    return result
+
+def run_pipeline(input_dir, output_dir, trace_memory, workers=1, executor='thread'):
+    """Time every stage of the batch build, then the streaming build, on one generated inventory"""
+    stages = []
+    for subdirectory in ('assembly', 'pixel', 'pixels', 'index'):
+        os.makedirs(f'{output_dir}/{subdirectory}', exist_ok=True)
+
+    generation_descriptions = measure(stages, 'load_generation_descriptions', trace_memory,
+                                      build.load_generation_descriptions, f'{input_dir}/generation_description.csv')
+    state_legend = measure(stages, 'load_state_legend', trace_memory,
+                           build.load_state_legend, f'{input_dir}/state_legend.csv')
+    master_table = measure(stages, 'load_master_table', trace_memory,
+                           build.load_master_table, f'{input_dir}/master.csv')
+    carbon_table = measure(stages, 'load_csv_table', trace_memory,
+                           build.load_csv_table, f'{input_dir}/carbon_location.csv')
+    pixel_networks = measure(stages, 'extract_reconfiguration_networks', trace_memory,
+                             build.extract_reconfiguration_networks, master_table)
+    carbon_locations_data = measure(stages, 'convert_carbon_locations_to_json', trace_memory,
+                                    build.convert_carbon_locations_to_json, carbon_table, pixel_networks)
+    master_data = measure(stages, 'convert_master_to_json', trace_memory,
+                          build.convert_master_to_json, master_table, generation_descriptions, state_legend)
+    timeline_data = measure(stages, 'create_timeline_json', trace_memory,
+                            build.create_timeline_json, master_table, carbon_table)
+    pixel_files = measure(stages, 'create_individual_pixel_files', trace_memory,
+                          build.create_individual_pixel_files, master_data, timeline_data)
+    simplified_pixels = measure(stages, 'create_simplified_pixels_json', trace_memory,
+                                build.create_simplified_pixels_json, master_data, timeline_data)
+    measure(stages, 'create_pixel_pages', trace_memory, build.create_pixel_pages, simplified_pixels)
+    measure(stages, 'create_filter_indexes', trace_memory,
+            build.create_filter_indexes, simplified_pixels, pixel_networks)
+    aggregates = measure(stages, 'create_aggregates', trace_memory,
+                         build.create_aggregates, build.pixel_records(master_data, timeline_data), pixel_networks)
+    routes = measure(stages, 'create_routes', trace_memory, build.create_routes, timeline_data)
+    results = {
+        'carbon_locations': carbon_locations_data,
+        'simplified_pixels': simplified_pixels,
+        'pixel_networks': pixel_networks,
+        'aggregates': aggregates,
+        'routes': routes
+    }
+    outputs = measure(stages, 'bank_outputs', trace_memory,
+                      build.bank_outputs, results, {"output_format": 'pretty', "page_size": build.PIXEL_PAGE_SIZE})
+    measure(stages, 'write_bank', trace_memory,
+            build.write_bank, output_dir, outputs, pixel_files, workers, executor)
+    measure(stages, 'write_sqlite', trace_memory,
+            build.write_sqlite, f'{output_dir}/bank.sqlite', build.pixel_records(master_data, timeline_data),
+            carbon_locations_data, pixel_networks)
+
+    # Drop the batch build's data so the streaming peak is measured on its own
+    del master_table, carbon_table, master_data, timeline_data, pixel_files, simplified_pixels, aggregates, routes
+    del results, outputs
+    shutil.rmtree(output_dir)
+    for subdirectory in ('assembly', 'pixel', 'pixels', 'index'):
+        os.makedirs(f'{output_dir}/{subdirectory}', exist_ok=True)
+    measure(stages, 'write_bank_streaming', trace_memory,
+            build.write_bank_streaming, input_dir, output_dir, generation_descriptions, state_legend)
+    return stages
+
+def compare_to_baseline(results, baseline, tolerance, min_seconds, memory_tolerance, min_bytes):
+    """Return a description of every stage that got slower than tolerance times its baseline, or
+    whose peak memory grew beyond memory_tolerance times its baseline"""
+    previous = {
+        (run["pixels"], run["reconfigurations"], stage["name"]): stage
+        for run in baseline["runs"] for stage in run["stages"]
+    }
+    regressions = []
+    for run in results["runs"]:
+        for stage in run["stages"]:
+            before = previous.get((run["pixels"], run["reconfigurations"], stage["name"]))
+            if before is None:
+                continue
+            where = f"{stage['name']} at {run['pixels']} pixels x {run['reconfigurations']} reconfigurations"
+            if stage["seconds"] >= min_seconds and stage["seconds"] > before["seconds"] * tolerance:
+                regressions.append(f"{where}: {before['seconds']:.3f}s -> {stage['seconds']:.3f}s")
+            # Only runs that both traced memory have peaks to compare
+            if "peak_bytes" not in stage or "peak_bytes" not in before or stage["peak_bytes"] < min_bytes:
+                continue
+            if stage["peak_bytes"] > before["peak_bytes"] * memory_tolerance:
+                regressions.append(f"{where}: peak {before['peak_bytes'] / 2**20:.1f} MiB -> "
+                                   f"{stage['peak_bytes'] / 2**20:.1f} MiB")
+    return regressions
+
+def parse_list(value):
+    return [int(item) for item in value.split(',') if item.strip()]
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark each stage of translate_to_json.py on synthetic inventories")
+    parser.add_argument('--sizes', type=parse_list, default=QUICK_SIZES,
+                        help="comma-separated pixel counts (default: 1000,10000; --full uses 1k to 1M)")
+    parser.add_argument('--full', action='store_true',
+                        help=f"benchmark {','.join(map(str, FULL_SIZES))} pixels")
+    parser.add_argument('--reconfigurations', type=parse_list, default=[15],
+                        help="comma-separated reconfiguration counts, e.g. 15,100,300 (default: 15)")
+    parser.add_argument('--workers', type=int, default=1, help="writer workers for the write_bank stage")
+    parser.add_argument('--executor', choices=['thread', 'process'], default='thread')
+    parser.add_argument('--no-memory', action='store_true',
+                        help="skip tracemalloc peak measurement, which slows the stages down")
+    parser.add_argument('--seed', type=int, default=0, help="seed for the synthetic inventory")
+    parser.add_argument('--output', default='benchmark_results.json', help="where to write the results")
+    parser.add_argument('--baseline', help="earlier results file to compare stage timings and peak memory against")
+    parser.add_argument('--tolerance', type=float, default=1.5,
+                        help="fail when a stage is slower than this multiple of the baseline (default: 1.5)")
+    parser.add_argument('--min-seconds', type=float, default=0.05,
+                        help="ignore stages faster than this when comparing to the baseline (default: 0.05)")
+    parser.add_argument('--memory-tolerance', type=float, default=1.5,
+                        help="fail when the peak memory of a stage exceeds this multiple of the baseline "
+                             "(default: 1.5)")
+    parser.add_argument('--min-bytes', type=int, default=1 << 20,
+                        help="ignore stages peaking below this many bytes when comparing memory to the baseline "
+                             "(default: 1 MiB)")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    sizes = FULL_SIZES if args.full else args.sizes
+    trace_memory = not args.no_memory
+    results = {
+        "created": datetime.now().isoformat(timespec='seconds'),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "memory_traced": trace_memory,
+        "workers": args.workers,
+        "executor": args.executor,
+        "runs": []
+    }
+
+    if trace_memory:
+        tracemalloc.start()
+    try:
+        for reconfiguration_count in args.reconfigurations:
+            for pixel_count in sizes:
+                with tempfile.TemporaryDirectory(prefix='pixelframe-bench-') as workdir:
+                    input_dir = f'{workdir}/originals'
+                    generate_inventory(input_dir, pixel_count, reconfiguration_count, args.seed)
+                    stages = run_pipeline(input_dir, f'{workdir}/bank', trace_memory, args.workers, args.executor)
+                    run = {
+                        "pixels": pixel_count,
+                        "reconfigurations": reconfiguration_count,
+                        "input_bytes": input_sizes(input_dir),
+                        "stages": stages,
+                        "total_seconds": round(sum(stage["seconds"] for stage in stages
+                                                   if stage["name"] != 'write_bank_streaming'), 6)
+                    }
+                results["runs"].append(run)
+                slowest = max(stages, key=lambda stage: stage["seconds"])
+                print(f"{pixel_count:>9} pixels x {reconfiguration_count:>4} reconfigurations: "
+                      f"{run['total_seconds']:.3f}s batch, slowest stage {slowest['name']} ({slowest['seconds']:.3f}s)")
+    finally:
+        if trace_memory:
+            tracemalloc.stop()
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(results, baseline, args.tolerance, args.min_seconds,
+                                          args.memory_tolerance, args.min_bytes)
+        for regression in regressions:
+            print(f"  regression: {regression}")
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
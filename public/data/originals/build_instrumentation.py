@@ -0,0 +1,89 @@
+from contextlib import contextmanager
+import os
+import pstats
+import threading
+import time
+
+
+# Opt-in build instrumentation, enabled by --report/--profile; None means nothing is recorded
+_instrumentation = None
+_instrumentation_lock = threading.Lock()
+
+def start_instrumentation():
+    """Start recording stage timings, rows read, files written and cache counters"""
+    global _instrumentation
+    _instrumentation = {
+        "stages": [],
+        "rows_read": {},
+        "files_written": 0,
+        "bytes_written": 0,
+        "counters": {}
+    }
+
+def stop_instrumentation():
+    """Stop recording and return everything recorded since start_instrumentation"""
+    global _instrumentation
+    recorded, _instrumentation = _instrumentation, None
+    return recorded
+
+@contextmanager
+def instrument_stage(name):
+    """Record the wall and CPU time of the enclosed build stage"""
+    if _instrumentation is None:
+        yield
+        return
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    try:
+        yield
+    finally:
+        _instrumentation["stages"].append({
+            "name": name,
+            "wall_seconds": round(time.perf_counter() - wall_start, 6),
+            "cpu_seconds": round(time.process_time() - cpu_start, 6)
+        })
+
+def record_rows(source, count):
+    """Record that count rows were read from source"""
+    if _instrumentation is not None:
+        rows_read = _instrumentation["rows_read"]
+        rows_read[os.path.basename(source)] = rows_read.get(os.path.basename(source), 0) + count
+
+def record_write(size):
+    """Record one written file of size bytes; safe to call from writer threads"""
+    if _instrumentation is not None:
+        with _instrumentation_lock:
+            _instrumentation["files_written"] += 1
+            _instrumentation["bytes_written"] += size
+
+def count_event(name, amount=1):
+    """Add amount to a named counter, e.g. files skipped because they were up to date"""
+    if _instrumentation is not None:
+        with _instrumentation_lock:
+            counters = _instrumentation["counters"]
+            counters[name] = counters.get(name, 0) + amount
+
+def profile_hot_spots(profiler, top):
+    """The functions with the highest cumulative time in a cProfile run"""
+    stats = pstats.Stats(profiler)
+    hot_spots = []
+    for (filename, line, function), (_, calls, total_time, cumulative_time, _) in stats.stats.items():
+        hot_spots.append({
+            "function": f"{os.path.basename(filename)}:{line}({function})",
+            "calls": calls,
+            "total_seconds": round(total_time, 6),
+            "cumulative_seconds": round(cumulative_time, 6)
+        })
+    hot_spots.sort(key=lambda hot_spot: hot_spot["cumulative_seconds"], reverse=True)
+    return hot_spots[:top]
+
+def allocation_hot_spots(snapshot, top):
+    """The source lines holding the most memory in a tracemalloc snapshot"""
+    return [
+        {
+            "location": f"{os.path.basename(stat.traceback[0].filename)}:{stat.traceback[0].lineno}",
+            "size_bytes": stat.size,
+            "blocks": stat.count
+        }
+        for stat in snapshot.statistics('lineno')[:top]
+    ]
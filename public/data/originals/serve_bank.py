@@ -0,0 +1,381 @@
+import argparse
+import asyncio
+from bisect import bisect_left, bisect_right
+from datetime import date
+from functools import partial
+import json
+import os
+import sys
+import time
+from urllib.parse import parse_qs, unquote, urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import translate_to_json as build  # noqa: E402
+
+
+# The build stages whose results the server keeps in memory
+SERVED_STAGES = ['master_data', 'timeline_data', 'simplified_pixels', 'pixel_networks', 'carbon_locations']
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 1000
+RESPONSE_CACHE_SIZE = 4096
+MAX_HEADER_LINES = 100
+MAX_DISCARDED_BODY = 1 << 20  # request bodies are never used; larger ones close the connection
+STATUS_REASONS = {
+    200: 'OK',
+    206: 'Partial Content',
+    304: 'Not Modified',
+    400: 'Bad Request',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    416: 'Range Not Satisfiable'
+}
+
+
+def load_bank(base_path):
+    """Run the build stages over the originals and index their results for querying"""
+    snapshot = build.snapshot_originals(base_path)
+    version = build.hash_text(json.dumps([
+        build.hash_file(f'{base_path}/{filename}') for filename in sorted(build.WATCHED_FILES)
+    ]))
+    results = build.run_stages(SERVED_STAGES, base_path)
+
+    # Duplicate pixel numbers resolve to their last row, like the per-pixel files do
+    records = {pixel.pixel_number: (pixel, pixel_timeline)
+               for pixel, pixel_timeline in build.pixel_records(results['master_data'], results['timeline_data'])}
+    
+    # The dated step totals of every pixel sorted by date, so a date range is two bisections
+    dated_steps = {}
+    for pixel_number, (_, pixel_timeline) in records.items():
+        if pixel_timeline is None:
+            continue
+        steps = []
+        for step in pixel_timeline.steps:
+            step_date = build.parse_timeline_date(step.date)
+            if step_date is not None:
+                steps.append((step_date, step.step_total))
+        if steps:
+            steps.sort(key=lambda step: step[0])
+            dated_steps[pixel_number] = ([step_date for step_date, _ in steps], [total for _, total in steps])
+
+    by_state = {}
+    by_generation = {}
+    for entry in results['simplified_pixels']["pixels"]:
+        if entry["state"] is not None:
+            by_state.setdefault(entry["state"], set()).add(entry["pixel_number"])
+        if entry["generation"] is not None:
+            by_generation.setdefault(entry["generation"], set()).add(entry["pixel_number"])
+    assemblies = results['carbon_locations']["reconfigurations"]
+
+    return {
+        "version": version[:16],
+        "snapshot": snapshot,
+        "pixels": results['simplified_pixels']["pixels"],
+        "records": records,
+        "dated_steps": dated_steps,
+        "filters": {
+            "state": by_state,
+            "generation": by_generation,
+            "reconfiguration": {number: set(network) for number, network in results['pixel_networks'].items()}
+        },
+        "assemblies": assemblies,
+        "assemblies_by_number": {assembly["number"]: assembly for assembly in assemblies},
+        "responses": {}
+    }
+
+def query_ints(query, key):
+    """The integers given for a query parameter, repeated or comma-separated"""
+    values = []
+    for value in query.get(key, []):
+        for item in value.split(','):
+            if item.strip():
+                try:
+                    values.append(int(item))
+                except ValueError:
+                    raise ValueError(f"{key} must be an integer, got {item!r}")
+    return values
+
+def query_int(query, key, default, minimum, maximum=None):
+    values = query_ints(query, key)
+    value = values[-1] if values else default
+    if value < minimum or (maximum is not None and value > maximum):
+        raise ValueError(f"{key} must be between {minimum} and {maximum}" if maximum is not None
+                         else f"{key} must be at least {minimum}")
+    return value
+
+def query_date(query, key):
+    values = query.get(key)
+    if not values:
+        return None
+    try:
+        return date.fromisoformat(values[-1])
+    except ValueError:
+        raise ValueError(f"{key} must be a YYYY-MM-DD date, got {values[-1]!r}")
+
+def filter_pixels(bank, query):
+    """The pixels.json entries matching every state, generation and reconfiguration filter; several
+    values for one filter match any of them"""
+    matching = None
+    for key, index in bank["filters"].items():
+        values = query_ints(query, key)
+        if not values:
+            continue
+        selected = set().union(*(index.get(value, set()) for value in values))
+        matching = selected if matching is None else matching & selected
+    if matching is None:
+        return bank["pixels"]
+    return [entry for entry in bank["pixels"] if entry["pixel_number"] in matching]
+
+def paginate(items, query):
+    offset = query_int(query, 'offset', 0, 0)
+    limit = query_int(query, 'limit', DEFAULT_LIMIT, 1, MAX_LIMIT)
+    return {"total": len(items), "offset": offset, "limit": limit, "items": items[offset:offset + limit]}
+
+def emissions_in_range(bank, query):
+    """Sum the timeline step emissions dated between from and to (inclusive) per matching pixel"""
+    start = query_date(query, 'from')
+    end = query_date(query, 'to')
+    pixels = []
+    total = 0
+    for entry in filter_pixels(bank, query):
+        dated_steps = bank["dated_steps"].get(entry["pixel_number"])
+        if dated_steps is None:
+            continue
+        dates, totals = dated_steps
+        first = bisect_left(dates, start) if start else 0
+        last = bisect_right(dates, end) if end else len(dates)
+        if first < last:
+            emissions = sum(totals[first:last])
+            pixels.append({"pixel_number": entry["pixel_number"], "emissions": round(emissions, 6),
+                           "steps": last - first})
+            total += emissions
+    return {
+        "from": start.isoformat() if start else None,
+        "to": end.isoformat() if end else None,
+        "total_emissions": round(total, 6),
+        **paginate(pixels, query)
+    }
+
+def route(bank, path, query):
+    """Answer a query path with a (status, data) pair"""
+    parts = [part for part in path.split('/') if part]
+    if not parts:
+        return 200, {
+            "version": bank["version"],
+            "pixels": len(bank["pixels"]),
+            "assemblies": len(bank["assemblies"]),
+            "endpoints": [
+                "/pixels?state=&generation=&reconfiguration=&offset=&limit=",
+                "/pixels/NNNN",
+                "/assemblies",
+                "/assemblies/N",
+                "/emissions?from=YYYY-MM-DD&to=YYYY-MM-DD&state=&generation=&reconfiguration=&offset=&limit="
+            ]
+        }
+    if parts == ['pixels']:
+        return 200, paginate(filter_pixels(bank, query), query)
+    if parts[0] == 'pixels' and len(parts) == 2 and parts[1].isdigit():
+        record = bank["records"].get(int(parts[1]))
+        if record is None:
+            return 404, {"error": f"no pixel {parts[1]}"}
+        return 200, build.create_pixel_file(*record)
+    if parts == ['assemblies']:
+        return 200, paginate(bank["assemblies"], query)
+    if parts[0] == 'assemblies' and len(parts) == 2 and parts[1].isdigit():
+        assembly = bank["assemblies_by_number"].get(int(parts[1]))
+        if assembly is None:
+            return 404, {"error": f"no assembly {parts[1]}"}
+        return 200, assembly
+    if parts == ['emissions']:
+        return 200, emissions_in_range(bank, query)
+    return 404, {"error": f"unknown path {path}"}
+
+def cached_response(bank, target):
+    """The status, ETag and body of a request target, serialized once per version of the bank"""
+    response = bank["responses"].get(target)
+    if response is None:
+        url = urlsplit(target)
+        try:
+            status, data = route(bank, unquote(url.path), parse_qs(url.query))
+        except ValueError as error:
+            status, data = 400, {"error": str(error)}
+        body = build.serialize_json(data, 'compact').encode('utf-8')
+        response = (status, f'"{build.hash_text(body.decode("utf-8"))[:32]}"', body)
+        if len(bank["responses"]) >= RESPONSE_CACHE_SIZE:
+            bank["responses"].clear()
+        bank["responses"][target] = response
+    return response
+
+def etag_matches(header, etag):
+    return header is not None and (header.strip() == '*' or etag in [tag.strip() for tag in header.split(',')])
+
+def byte_range(header, length):
+    """Parse a single "bytes=start-end" range into inclusive offsets; None to serve the whole body,
+    or ValueError when the range cannot be satisfied"""
+    unit, _, spec = header.partition('=')
+    if unit.strip() != 'bytes' or ',' in spec:
+        return None
+    first, _, last = spec.strip().partition('-')
+    try:
+        if not first:
+            suffix = int(last)
+        else:
+            start = int(first)
+            end = min(int(last), length - 1) if last else length - 1
+    except ValueError:
+        return None
+    if not first:
+        if suffix == 0:
+            raise ValueError("empty suffix range")
+        return max(0, length - suffix), length - 1
+    if start >= length or end < start:
+        raise ValueError("range not satisfiable")
+    return start, end
+
+def respond(bank, method, target, headers):
+    """Build the status, response headers and body of a request"""
+    if method not in ('GET', 'HEAD'):
+        body = build.serialize_json({"error": f"method {method} not allowed"}, 'compact').encode('utf-8')
+        return 405, {"Allow": "GET, HEAD", "Content-Type": "application/json"}, body
+
+    status, etag, body = cached_response(bank, target)
+    response_headers = {
+        "Content-Type": "application/json",
+        "ETag": etag,
+        "Cache-Control": "no-cache",
+        "Accept-Ranges": "bytes"
+    }
+    if status != 200:
+        return status, response_headers, body
+    if etag_matches(headers.get('if-none-match'), etag):
+        return 304, response_headers, b''
+
+    range_header = headers.get('range')
+    if range_header and (headers.get('if-range') in (None, etag)):
+        try:
+            span = byte_range(range_header, len(body))
+        except ValueError:
+            response_headers["Content-Range"] = f"bytes */{len(body)}"
+            return 416, response_headers, b''
+        if span is not None:
+            start, end = span
+            response_headers["Content-Range"] = f"bytes {start}-{end}/{len(body)}"
+            return 206, response_headers, body[start:end + 1]
+    return 200, response_headers, body
+
+async def read_headers(reader):
+    headers = {}
+    for _ in range(MAX_HEADER_LINES):
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            return headers
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    raise ValueError("too many header lines")
+
+async def discard_body(reader, headers):
+    """Read and drop the body of a request, returning False if it cannot be skipped safely, in which
+    case the connection has to close after the response"""
+    if 'transfer-encoding' in headers:
+        return False
+    try:
+        length = int(headers.get('content-length', '0'))
+    except ValueError:
+        return False
+    if not 0 <= length <= MAX_DISCARDED_BODY:
+        return False
+    await reader.readexactly(length)
+    return True
+
+async def handle_connection(server, reader, writer):
+    """Serve the requests of one keep-alive connection"""
+    try:
+        while True:
+            try:
+                # readline raises ValueError for lines longer than the reader's limit
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, version = request_line.decode('latin-1').split()
+                headers = await read_headers(reader)
+            except ValueError:
+                writer.write(b'HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\nConnection: close\r\n\r\n')
+                break
+            body_skipped = await discard_body(reader, headers)
+
+            bank = server["bank"]
+            if method in ('GET', 'HEAD') and target not in bank["responses"]:
+                # Answering a new query can scan every pixel, so keep it off the event loop
+                await asyncio.to_thread(cached_response, bank, target)
+            status, response_headers, body = respond(bank, method, target, headers)
+            keep_alive = (body_skipped and headers.get('connection', '').lower() != 'close'
+                          and (version == 'HTTP/1.1' or headers.get('connection', '').lower() == 'keep-alive'))
+            response_headers["Content-Length"] = str(len(body))
+            response_headers["Connection"] = 'keep-alive' if keep_alive else 'close'
+            head = f"HTTP/1.1 {status} {STATUS_REASONS[status]}\r\n" + ''.join(
+                f"{name}: {value}\r\n" for name, value in response_headers.items()) + "\r\n"
+            writer.write(head.encode('latin-1'))
+            if method != 'HEAD':
+                writer.write(body)
+            await writer.drain()
+            if not keep_alive:
+                break
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+async def reload_when_changed(server, base_path, interval):
+    """Reload the bank in a worker thread whenever the originals change, swapping it in when ready"""
+    failed = None
+    while True:
+        await asyncio.sleep(interval)
+        snapshot = build.snapshot_originals(base_path)
+        if snapshot in (server["bank"]["snapshot"], failed):
+            continue
+        started = time.perf_counter()
+        try:
+            bank = await asyncio.to_thread(load_bank, base_path)
+        except Exception as error:
+            # Keep serving the last good bank until the originals are fixed
+            failed = snapshot
+            print(f"Reload failed: {error!r}", file=sys.stderr)
+            continue
+        failed = None
+        server["bank"] = bank
+        print(f"Reloaded bank version {bank['version']} in {time.perf_counter() - started:.3f}s")
+
+async def serve(args):
+    server = {"bank": load_bank(args.originals)}
+    listener = await asyncio.start_server(partial(handle_connection, server), args.host, args.port)
+    print(f"Serving bank version {server['bank']['version']} on http://{args.host}:{args.port}/")
+    reloader = None
+    if args.reload_interval > 0:
+        reloader = asyncio.create_task(reload_when_changed(server, args.originals, args.reload_interval))
+    async with listener:
+        try:
+            await listener.serve_forever()
+        finally:
+            if reloader is not None:
+                reloader.cancel()
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Serve filtered and paginated queries over the bank, built in memory from the CSV originals")
+    parser.add_argument('--host', default='127.0.0.1', help="address to listen on (default: 127.0.0.1)")
+    parser.add_argument('--port', type=int, default=8765, help="port to listen on (default: 8765)")
+    parser.add_argument('--originals', default=build.BASE_PATH,
+                        help=f"directory of the CSV originals (default: {build.BASE_PATH})")
+    parser.add_argument('--reload-interval', type=float, default=2.0,
+                        help="seconds between checks for changed originals, 0 to never reload (default: 2.0)")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        print("Stopped serving")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+from array import array
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import bank_aggregates  # noqa: E402
+
+
+# Sorted values with numpy.percentile(values, q) for q in PERCENTILES (25, 50, 75, 90), using its
+# default linear interpolation
+KNOWN_PERCENTILES = [
+    ([7.0], [7.0, 7.0, 7.0, 7.0]),
+    ([1.0, 2.0], [1.25, 1.5, 1.75, 1.9]),
+    ([1.0, 2.5, 3.5, 4.0, 9.0], [2.5, 3.5, 4.0, 7.0]),
+    ([10.0, 20.0, 30.0, 40.0, 50.0, 60.0, 70.0, 80.0, 90.0, 100.0], [32.5, 55.0, 77.5, 91.0])
+]
+
+
+class PercentileTest(unittest.TestCase):
+
+    def test_matches_numpy(self):
+        for values, expected in KNOWN_PERCENTILES:
+            for q, percentile in zip(bank_aggregates.PERCENTILES, expected):
+                with self.subTest(values=values, q=q):
+                    self.assertAlmostEqual(bank_aggregates.percentile(values, q), percentile)
+
+    def test_extremes(self):
+        values = [1.0, 2.5, 3.5, 4.0, 9.0]
+        self.assertEqual(bank_aggregates.percentile(values, 0), 1.0)
+        self.assertEqual(bank_aggregates.percentile(values, 100), 9.0)
+
+    def test_only_the_positions_it_falls_between_are_needed(self):
+        for values, expected in KNOWN_PERCENTILES:
+            positions = bank_aggregates.percentile_positions(len(values))
+            picked = {position: values[position] for position in positions}
+            for q, percentile in zip(bank_aggregates.PERCENTILES, expected):
+                with self.subTest(values=values, q=q):
+                    self.assertAlmostEqual(bank_aggregates.percentile(picked, q, len(values)), percentile)
+
+
+class SummarizeColumnTest(unittest.TestCase):
+
+    def test_matches_numpy(self):
+        for values, expected in KNOWN_PERCENTILES:
+            with self.subTest(values=values):
+                # Unsorted, like the rollup columns
+                summary = bank_aggregates.summarize_column(array('d', reversed(values)))
+                self.assertEqual(summary["count"], len(values))
+                self.assertAlmostEqual(summary["total"], sum(values))
+                self.assertAlmostEqual(summary["mean"], sum(values) / len(values))
+                self.assertEqual((summary["min"], summary["max"]), (values[0], values[-1]))
+                self.assertEqual([summary[f"p{q}"] for q in bank_aggregates.PERCENTILES], expected)
+
+    def test_empty(self):
+        summary = bank_aggregates.summarize_column(array('d'))
+        self.assertEqual(summary, {"count": 0, "total": 0.0, "mean": None, "min": None, "max": None,
+                                   "p25": None, "p50": None, "p75": None, "p90": None})
+
+    def test_single_element(self):
+        summary = bank_aggregates.summarize_column(array('d', [4.2]))
+        self.assertEqual(summary, {"count": 1, "total": 4.2, "mean": 4.2, "min": 4.2, "max": 4.2,
+                                   "p25": 4.2, "p50": 4.2, "p75": 4.2, "p90": 4.2})
+
+    def test_subset_of_rows(self):
+        column = array('d', [100.0, 1.0, 2.0, 50.0])
+        summary = bank_aggregates.summarize_column(column, [1, 2])
+        self.assertEqual((summary["count"], summary["total"], summary["p25"], summary["p90"]), (2, 3.0, 1.25, 1.9))
+        self.assertEqual(bank_aggregates.summarize_column(column, [])["count"], 0)
+
+    def test_ordered_values_are_read_once(self):
+        values, expected = KNOWN_PERCENTILES[-1]
+        summary = bank_aggregates.summarize_ordered(len(values), iter(values))
+        self.assertEqual([summary[f"p{q}"] for q in bank_aggregates.PERCENTILES], expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import math
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import bank_routes  # noqa: E402
+
+
+CAMBRIDGE = (42.3666, -71.1057)
+VENICE = (45.4408, 12.3155)
+
+
+def decode_polyline(encoded):
+    """Undo encode_polyline: sum the deltas back into quantized (longitude, latitude) points"""
+    points = []
+    lon = lat = 0
+    for i in range(0, len(encoded), 2):
+        lon += encoded[i]
+        lat += encoded[i + 1]
+        points.append((lon / bank_routes.ROUTE_SCALE, lat / bank_routes.ROUTE_SCALE))
+    return points
+
+
+class DensifyGreatCircleTest(unittest.TestCase):
+
+    def assertStepsWithinLimit(self, points):
+        limit_km = math.radians(bank_routes.ROUTE_STEP_DEGREES) * bank_routes.EARTH_RADIUS_KM
+        for (lon1, lat1), (lon2, lat2) in zip(points, points[1:]):
+            self.assertLessEqual(bank_routes.great_circle_km((lat1, lon1), (lat2, lon2)), limit_km + 1e-6)
+
+    def test_endpoints_are_exact(self):
+        points = bank_routes.densify_great_circle(CAMBRIDGE, VENICE)
+        self.assertEqual(points[0], (CAMBRIDGE[1], CAMBRIDGE[0]))
+        self.assertEqual(points[-1], (VENICE[1], VENICE[0]))
+        self.assertGreater(len(points), 2)
+        self.assertStepsWithinLimit(points)
+
+    def test_zero_length_leg(self):
+        points = bank_routes.densify_great_circle(VENICE, VENICE)
+        self.assertEqual(points, [(VENICE[1], VENICE[0])] * 2)
+        self.assertEqual(bank_routes.encode_polyline(points)[2:], [0, 0])
+
+    def test_antimeridian_is_crossed_the_short_way(self):
+        start, end = (10.0, 170.0), (10.0, -170.0)
+        points = bank_routes.densify_great_circle(start, end)
+        self.assertEqual(points[0], (170.0, 10.0))
+        self.assertEqual(points[-1], (-170.0, 10.0))
+        # The arc stays on the Pacific side instead of going round through longitude 0
+        for longitude, latitude in points:
+            self.assertGreaterEqual(abs(longitude), 170.0 - 1e-9)
+            self.assertGreaterEqual(latitude, 10.0 - 1e-9)
+        self.assertStepsWithinLimit(points)
+
+
+class EncodePolylineTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        for start, end in ((CAMBRIDGE, VENICE), ((10.0, 170.0), (10.0, -170.0)), ((-33.9, 151.2), (51.5, -0.1))):
+            with self.subTest(start=start, end=end):
+                points = bank_routes.densify_great_circle(start, end)
+                decoded = decode_polyline(bank_routes.encode_polyline(points))
+                self.assertEqual(len(decoded), len(points))
+                for (lon, lat), (decoded_lon, decoded_lat) in zip(points, decoded):
+                    self.assertAlmostEqual(decoded_lon, lon, delta=0.5 / bank_routes.ROUTE_SCALE)
+                    self.assertAlmostEqual(decoded_lat, lat, delta=0.5 / bank_routes.ROUTE_SCALE)
+
+    def test_first_point_absolute_then_deltas(self):
+        encoded = bank_routes.encode_polyline([(12.3155, 45.4408), (12.3156, 45.4406)])
+        self.assertEqual(encoded, [123155, 454408, 1, -2])
+
+    def test_empty(self):
+        self.assertEqual(bank_routes.encode_polyline([]), [])
+
+
+class DistanceDisagreesTest(unittest.TestCase):
+
+    def test_bounds(self):
+        computed = 1000
+        lower = computed * (1 - bank_routes.DISTANCE_CHECK_TOLERANCE)
+        self.assertFalse(bank_routes.distance_disagrees(computed, computed))
+        self.assertFalse(bank_routes.distance_disagrees(lower, computed))
+        self.assertTrue(bank_routes.distance_disagrees(lower - 1, computed))
+        upper = computed * bank_routes.DISTANCE_CHECK_DETOUR + bank_routes.DISTANCE_CHECK_SLACK_KM
+        self.assertFalse(bank_routes.distance_disagrees(upper, computed))
+        self.assertTrue(bank_routes.distance_disagrees(upper + 1, computed))
+
+    def test_same_location(self):
+        self.assertFalse(bank_routes.distance_disagrees(0, 0))
+        self.assertFalse(bank_routes.distance_disagrees(bank_routes.DISTANCE_CHECK_SLACK_KM, 0))
+        self.assertTrue(bank_routes.distance_disagrees(bank_routes.DISTANCE_CHECK_SLACK_KM + 1, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
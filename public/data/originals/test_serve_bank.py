@@ -0,0 +1,155 @@
+import asyncio
+import json
+import os
+import re
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import serve_bank  # noqa: E402
+
+
+ORIGINALS = os.path.dirname(os.path.abspath(__file__))
+
+
+class RecordingWriter:
+    """Stands in for the StreamWriter of a connection, keeping everything written to it"""
+
+    def __init__(self):
+        self.data = bytearray()
+
+    def write(self, data):
+        self.data += data
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class ByteRangeTest(unittest.TestCase):
+
+    def test_satisfiable_ranges(self):
+        self.assertEqual(serve_bank.byte_range('bytes=0-9', 100), (0, 9))
+        self.assertEqual(serve_bank.byte_range('bytes=90-', 100), (90, 99))
+        self.assertEqual(serve_bank.byte_range('bytes=95-200', 100), (95, 99))
+        self.assertEqual(serve_bank.byte_range('bytes=-10', 100), (90, 99))
+        self.assertEqual(serve_bank.byte_range('bytes=-200', 100), (0, 99))
+
+    def test_ranges_served_whole(self):
+        for header in ('items=0-9', 'bytes=0-1,5-6', 'bytes=a-9', 'bytes=0-b'):
+            with self.subTest(header):
+                self.assertIsNone(serve_bank.byte_range(header, 100))
+
+    def test_unsatisfiable_ranges(self):
+        for header in ('bytes=100-', 'bytes=9-5', 'bytes=-0'):
+            with self.subTest(header):
+                with self.assertRaises(ValueError):
+                    serve_bank.byte_range(header, 100)
+
+
+class EtagMatchesTest(unittest.TestCase):
+
+    def test_matches(self):
+        self.assertTrue(serve_bank.etag_matches('"abc"', '"abc"'))
+        self.assertTrue(serve_bank.etag_matches('"xyz", "abc"', '"abc"'))
+        self.assertTrue(serve_bank.etag_matches('*', '"abc"'))
+        self.assertFalse(serve_bank.etag_matches('"xyz"', '"abc"'))
+        self.assertFalse(serve_bank.etag_matches(None, '"abc"'))
+
+
+class RespondTest(unittest.TestCase):
+    """Requests answered from the bank built in memory from the originals next to this file"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.bank = serve_bank.load_bank(ORIGINALS)
+
+    def get(self, target='/pixels', **headers):
+        return serve_bank.respond(self.bank, 'GET', target, {name.replace('_', '-'): value
+                                                              for name, value in headers.items()})
+
+    def test_not_modified(self):
+        status, headers, body = self.get()
+        self.assertEqual(status, 200)
+        status, _, body = self.get(if_none_match=headers["ETag"])
+        self.assertEqual((status, body), (304, b''))
+
+    def test_partial_content(self):
+        _, _, full = self.get()
+        status, headers, body = self.get(range='bytes=10-19')
+        self.assertEqual(status, 206)
+        self.assertEqual(body, full[10:20])
+        self.assertEqual(headers["Content-Range"], f"bytes 10-19/{len(full)}")
+
+    def test_range_not_satisfiable(self):
+        _, _, full = self.get()
+        status, headers, body = self.get(range=f'bytes={len(full)}-')
+        self.assertEqual((status, body), (416, b''))
+        self.assertEqual(headers["Content-Range"], f"bytes */{len(full)}")
+
+    def test_if_range_mismatch_serves_whole_body(self):
+        _, headers, full = self.get()
+        status, _, body = self.get(range='bytes=10-19', if_range='"stale"')
+        self.assertEqual((status, body), (200, full))
+        status, _, body = self.get(range='bytes=10-19', if_range=headers["ETag"])
+        self.assertEqual(status, 206)
+
+    def test_bad_query(self):
+        for target in ('/pixels?limit=0', '/pixels?state=x', '/emissions?from=2022-13-01'):
+            with self.subTest(target):
+                status, _, body = self.get(target)
+                self.assertEqual(status, 400)
+                self.assertIn("error", json.loads(body))
+
+    def test_emissions_in_range(self):
+        everything = json.loads(self.get('/emissions?limit=1000')[2])
+        part = json.loads(self.get('/emissions?from=2022-01-01&to=2022-12-31&limit=1000')[2])
+        self.assertLessEqual(part["total_emissions"], everything["total_emissions"])
+        steps = {item["pixel_number"]: item["steps"] for item in everything["items"]}
+        for item in part["items"]:
+            self.assertLessEqual(item["steps"], steps[item["pixel_number"]])
+
+
+class ConnectionTest(unittest.TestCase):
+    """Raw requests over one connection, answered by handle_connection"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.bank = serve_bank.load_bank(ORIGINALS)
+
+    def exchange(self, request):
+        async def run():
+            reader = asyncio.StreamReader()
+            reader.feed_data(request)
+            reader.feed_eof()
+            writer = RecordingWriter()
+            await serve_bank.handle_connection({"bank": self.bank}, reader, writer)
+            return bytes(writer.data)
+        return asyncio.run(run())
+
+    def statuses(self, response):
+        return [int(status) for status in re.findall(rb'HTTP/1\.1 (\d{3}) ', response)]
+
+    def test_overlong_request_line(self):
+        response = self.exchange(b'GET /' + b'x' * (1 << 17) + b' HTTP/1.1\r\n\r\n')
+        self.assertEqual(self.statuses(response), [400])
+
+    def test_request_body_is_skipped_before_next_request(self):
+        body = b'{"pixel_number": 5}'
+        response = self.exchange(
+            b'POST /pixels HTTP/1.1\r\nContent-Length: ' + str(len(body)).encode() + b'\r\n\r\n' + body
+            + b'GET / HTTP/1.1\r\nConnection: close\r\n\r\n')
+        self.assertEqual(self.statuses(response), [405, 200])
+
+    def test_unskippable_body_closes_connection(self):
+        response = self.exchange(b'POST /pixels HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n'
+                                 b'5\r\nhello\r\n0\r\n\r\nGET / HTTP/1.1\r\n\r\n')
+        self.assertEqual(self.statuses(response), [405])
+        self.assertIn(b'Connection: close', response)
+
+
+if __name__ == '__main__':
+    unittest.main()
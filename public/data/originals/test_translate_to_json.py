@@ -0,0 +1,192 @@
+import contextlib
+import csv
+import io
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import translate_to_json as build  # noqa: E402
+
+
+ORIGINALS = os.path.dirname(os.path.abspath(__file__))
+
+
+def read_tree(path):
+    """Map every file under path, relative to it, to its bytes"""
+    files = {}
+    for directory, _, filenames in os.walk(path):
+        for filename in filenames:
+            with open(os.path.join(directory, filename), 'rb') as f:
+                files[os.path.relpath(os.path.join(directory, filename), path)] = f.read()
+    return files
+
+def read_sqlite_rows(path):
+    """Map every table of a database to its rows, in a stable order"""
+    with contextlib.closing(sqlite3.connect(path)) as connection:
+        tables = [name for name, in connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+        return {table: sorted(connection.execute(f"SELECT * FROM {table}").fetchall(), key=repr) for table in tables}
+
+
+class BuildSequenceTest(unittest.TestCase):
+    """Builds of different kinds run one after another on a scratch copy of the originals"""
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp(prefix='pixelframe-test-')
+        shutil.copytree(ORIGINALS, f'{self.workdir}/{build.BASE_PATH}',
+                        ignore=shutil.ignore_patterns('*.py', '*.js', '__pycache__'))
+        self.previous_cwd = os.getcwd()
+        os.chdir(self.workdir)
+
+    def tearDown(self):
+        os.chdir(self.previous_cwd)
+        shutil.rmtree(self.workdir)
+
+    def build(self, *argv):
+        with contextlib.redirect_stdout(io.StringIO()):
+            build.main(list(argv))
+
+    def edit_csv(self, filename, key_column, key, column, value):
+        """Set one cell of an original, returning its previous bytes"""
+        path = f'{build.BASE_PATH}/{filename}'
+        with open(path, 'rb') as f:
+            original = f.read()
+        with open(path, 'r', newline='') as f:
+            rows = list(csv.reader(f))
+        header = rows[0]
+        for row in rows[1:]:
+            if row[header.index(key_column)] == key:
+                row[header.index(column)] = value
+        with open(path, 'w', newline='') as f:
+            csv.writer(f).writerows(rows)
+        return original
+
+    def append_csv_row(self, filename, cells):
+        """Append a row to an original, leaving the columns not in cells empty"""
+        path = f'{build.BASE_PATH}/{filename}'
+        with open(path, 'r', newline='') as f:
+            rows = list(csv.reader(f))
+        rows.append([cells.get(column, '') for column in rows[0]])
+        with open(path, 'w', newline='') as f:
+            csv.writer(f).writerows(rows)
+
+    def assertSameTree(self, actual, expected):
+        self.assertEqual(sorted(actual), sorted(expected))
+        for relative_path in expected:
+            with self.subTest(relative_path):
+                self.assertEqual(actual[relative_path], expected[relative_path])
+
+    def restore(self, filename, original):
+        with open(f'{build.BASE_PATH}/{filename}', 'wb') as f:
+            f.write(original)
+
+    def test_incremental_build_after_full_build(self):
+        self.build('--incremental')
+        expected = read_tree(build.OUTPUT_BASE_PATH)
+
+        original = self.edit_csv('master.csv', 'Pixel number', '5', 'State', '3')
+        self.build()
+        self.assertNotEqual(read_tree(build.OUTPUT_BASE_PATH)['pixel/pixel_0005.json'],
+                            expected['pixel/pixel_0005.json'])
+
+        # The full build rewrote files behind the manifest's back; reverting the edit must bring them back
+        self.restore('master.csv', original)
+        self.build('--incremental')
+        self.assertEqual(read_tree(build.OUTPUT_BASE_PATH), expected)
+
+    def test_stream_build_matches_full_build_with_duplicate_pixel(self):
+        # A second row for pixel 5 without a timeline; the last row wins, with its own (empty) timeline
+        self.append_csv_row('master.csv', {'Pixel number': '5', 'State': '2'})
+        self.build()
+        expected = read_tree(build.OUTPUT_BASE_PATH)
+        with open(build.SQLITE_PATH, 'rb') as f:
+            expected_sqlite = f.read()
+
+        shutil.rmtree(build.OUTPUT_BASE_PATH)
+        os.remove(build.SQLITE_PATH)
+        self.build('--stream')
+        self.assertSameTree(read_tree(build.OUTPUT_BASE_PATH), expected)
+        with open(build.SQLITE_PATH, 'rb') as f:
+            self.assertEqual(f.read(), expected_sqlite)
+
+    def test_target_build_after_full_build(self):
+        self.build('--target', 'assemblies')
+        expected = read_tree(build.OUTPUT_BASE_PATH)
+
+        original = self.edit_csv('carbon_location.csv', 'Reconfiguration number', '1', 'Description', 'Edited')
+        self.build()
+        self.restore('carbon_location.csv', original)
+        self.build('--target', 'assemblies')
+        self.assertEqual(read_tree(build.OUTPUT_BASE_PATH)['assembly/assemblies.json'],
+                         expected['assembly/assemblies.json'])
+
+    def test_target_build_updates_sqlite_export(self):
+        self.build()
+        self.edit_csv('master.csv', 'Pixel number', '5', 'State', '3')
+        self.build('--target', 'pixel:5')
+        connection = sqlite3.connect(build.SQLITE_PATH)
+        try:
+            state, = connection.execute("SELECT state FROM pixels WHERE pixel_number = 5").fetchone()
+        finally:
+            connection.close()
+        self.assertEqual(state, 3)
+
+    def test_assemblies_target_updates_only_its_rows_of_sqlite_export(self):
+        self.build()
+        with contextlib.closing(sqlite3.connect(build.SQLITE_PATH)) as connection:
+            memberships = connection.execute("SELECT COUNT(*) FROM pixel_reconfigurations").fetchone()
+            steps = connection.execute("SELECT location_name FROM timeline_steps WHERE reconfiguration_number = 1").fetchall()
+        self.edit_csv('carbon_location.csv', 'Reconfiguration number', '1', 'Location name', 'Test yard')
+        self.build('--target', 'assemblies')
+        with contextlib.closing(sqlite3.connect(build.SQLITE_PATH)) as connection:
+            location_name, = connection.execute("SELECT location_name FROM reconfigurations WHERE number = 1").fetchone()
+            self.assertEqual(location_name, 'Test yard')
+            self.assertEqual(connection.execute("SELECT COUNT(*) FROM pixel_reconfigurations").fetchone(), memberships)
+            # The timelines belong to the pixel targets, which are not rebuilt here
+            self.assertEqual(connection.execute(
+                "SELECT location_name FROM timeline_steps WHERE reconfiguration_number = 1").fetchall(), steps)
+
+    def test_watch_rebuild_after_carbon_edit_matches_full_build(self):
+        args = build.parse_args(['--watch'])
+        state = build.new_watch_state()
+        with contextlib.redirect_stdout(io.StringIO()):
+            build.rebuild_warm(state, list(build.WATCHED_FILES), args)
+            self.edit_csv('carbon_location.csv', 'Reconfiguration number', '1', 'Transport distance (km)', '4321')
+            derived, total = build.rebuild_warm(state, ['carbon_location.csv'], args)
+        # Only the rows whose timelines pass through reconfiguration 1 are derived again
+        self.assertGreater(derived, 0)
+        self.assertLess(derived, total)
+        warm = read_tree(build.OUTPUT_BASE_PATH)
+        warm_sqlite = read_sqlite_rows(build.SQLITE_PATH)
+
+        shutil.rmtree(build.OUTPUT_BASE_PATH)
+        os.remove(build.SQLITE_PATH)
+        self.build()
+        self.assertSameTree(warm, read_tree(build.OUTPUT_BASE_PATH))
+        self.assertEqual(warm_sqlite, read_sqlite_rows(build.SQLITE_PATH))
+
+    def test_hashed_assets_of_old_manifests_are_pruned(self):
+        names = []
+        for state in ('1', '2', '3', '4'):
+            self.edit_csv('master.csv', 'Pixel number', '5', 'State', state)
+            self.build('--hashed-assets', 'hashed')
+            with open(build.ASSET_MANIFEST_PATH, 'r') as f:
+                names.append(json.load(f)["files"]["bank/pixel/pixel_0005.json"]["file"])
+        self.assertEqual(len(set(names)), 4)
+        self.assertFalse(os.path.exists(f'hashed/{names[0]}'))
+        for name in names[1:]:
+            self.assertTrue(os.path.exists(f'hashed/{name}'))
+
+        # Without hashed files the manifest does not point at any
+        self.build()
+        with open(build.ASSET_MANIFEST_PATH, 'r') as f:
+            self.assertNotIn("file", json.load(f)["files"]["bank/pixel/pixel_0005.json"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,34 @@
+import argparse
+from array import array
+from collections import deque
+from contextlib import nullcontext, redirect_stdout
+import cProfile
 import csv
 import json
 from datetime import datetime
+from functools import partial
+from itertools import groupby
+from operator import is_, itemgetter
 import os
+import re
+import sqlite3
+import sys
+import time
+import tracemalloc
+
+from bank_aggregates import (add_dated_steps, assemble_aggregates, create_aggregates, new_rollup, parse_timeline_date,
+                             summarize_ordered)
+from bank_assets import HASHED_VERSIONS_KEPT, update_asset_manifest
+from bank_files import (JSON_FORMATS, StreamedArray, StreamedObject, file_stat, hash_file, hash_text,
+                        print_size_report, remove_stale_sidecars, serialize_json, snapshot_sizes, verify_file,
+                        write_compressed_sidecars, write_json_atomic, write_json_chunked, write_json_files,
+                        write_text_atomic)
+from bank_routes import add_pixel_legs, create_routes, create_routes_from_table, new_routes
+from bank_sqlite import (discard_sqlite_export, finish_sqlite_export, insert_pixel_record, network_memberships,
+                         open_sqlite_export, replace_pixel_records, replace_pixels, replace_reconfigurations,
+                         stream_sqlite, update_sqlite_export, write_sqlite)
+from build_instrumentation import (allocation_hot_spots, count_event, instrument_stage, profile_hot_spots,
+                                   record_rows, start_instrumentation, stop_instrumentation)
 
 
 def safe_get(row, key, default=None):
@@ -26,12 +53,94 @@ def safe_int(value, default=None):
     except (ValueError, TypeError):
         return default
 
+class Record:
+    """Base for the compact slotted records the stages pass around instead of nested dicts.
+    Records are only turned into dicts when they are serialized."""
+    __slots__ = ()
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            setattr(self, name, fields[name])
+
+class Location(Record):
+    __slots__ = ('name', 'latitude', 'longitude')
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "coordinates": {
+                "latitude": self.latitude,
+                "longitude": self.longitude
+            }
+        }
+
+class Reconfiguration(Record):
+    """The carbon_location.csv fields a timeline step takes from one reconfiguration"""
+    __slots__ = ('name', 'description', 'date', 'location', 'transport_type', 'transport_distance',
+                 'transport_emissions', 'a1_a3_emissions')
+
+class TimelineStep(Record):
+    __slots__ = ('step', 'reconfiguration_number', 'name', 'date', 'location', 'a1_a3', 'transport_emissions',
+                 'step_total', 'running_total', 'transport_type', 'distance', 'cumulative_distance', 'description')
+
+    def to_dict(self):
+        return {
+            "step": self.step,
+            "reconfiguration_number": self.reconfiguration_number,
+            "name": self.name,
+            "date": self.date,
+            "location": self.location.to_dict(),
+            "emissions": {
+                "a1_a3": self.a1_a3,
+                "transport": self.transport_emissions,
+                "step_total": self.step_total,
+                "running_total": self.running_total
+            },
+            "transport": {
+                "type": self.transport_type,
+                "distance": self.distance,
+                "cumulative_distance": self.cumulative_distance
+            },
+            "description": self.description
+        }
+
+class PixelTimeline(Record):
+    __slots__ = ('pixel_number', 'steps', 'total_emissions', 'total_distance')
+
+class Pixel(Record):
+    __slots__ = ('pixel_number', 'generation', 'generation_description', 'state_description', 'state', 'fc',
+                 'weight', 'concrete_mix', 'fiber_type', 'fiber_dosage', 'date_of_manufacture',
+                 'number_of_reconfigurations', 'reconfigurations', 'gif', 'notes')
+
+    def to_dict(self):
+        return {
+            "pixel_number": self.pixel_number,
+            "generation": self.generation,
+            "generation_description": self.generation_description,
+            "state_description": self.state_description,
+            "state": self.state,
+            "fc": self.fc,
+            "weight": self.weight,
+            "carbon_emissions_a1_a3": None,
+            "concrete_mix": self.concrete_mix,
+            "fiber": {
+                "type": self.fiber_type,
+                "dosage": self.fiber_dosage
+            },
+            "date_of_manufacture": self.date_of_manufacture,
+            "number_of_reconfigurations": self.number_of_reconfigurations,
+            "reconfigurations": dict(self.reconfigurations),
+            "gif": self.gif,
+            "notes": self.notes
+        }
+
 def load_generation_descriptions(csv_file):
     descriptions = {}
     with open(csv_file, 'r') as file:
         csv_reader = csv.DictReader(file)
         for row in csv_reader:
             descriptions[int(row['Generation number'])] = row['Description']
+    record_rows(csv_file, len(descriptions))
     return descriptions
 
 def load_state_legend(csv_file):
@@ -41,409 +150,1635 @@ def load_state_legend(csv_file):
         for row in csv_reader:
             if len(row) >= 2:  
                 states[int(row[0])] = row[1]  
+    record_rows(csv_file, len(states))
     return states
 
-def load_reconfigurations(csv_file):
-    """Load reconfiguration mappings from carbon_location.csv"""
-    reconfig_columns = {}
+def load_csv_table(csv_file):
+    """Read a CSV file once into memory as its header plus a list of row dicts"""
     with open(csv_file, 'r') as file:
         csv_reader = csv.DictReader(file)
-        for row in csv_reader:
-            number = safe_int(safe_get(row, 'Reconfiguration number'))
-            if number:
-                reconfig_columns[number] = {
-                    'name': safe_get(row, 'Reconfiguration name'),
-                    'description': safe_get(row, 'Description'),
-                    'date': safe_get(row, 'Date')
-                }
-    return reconfig_columns
+        rows = list(csv_reader)
+        fieldnames = csv_reader.fieldnames or []
+    record_rows(csv_file, len(rows))
+    return {"fieldnames": fieldnames, "rows": rows}
 
-def extract_pixels_for_reconfiguration(master_csv, reconfig_number):
-    """Extract pixel numbers that are part of a specific reconfiguration"""
-    pixel_network = []
-    
-    with open(master_csv, 'r') as file:
-        csv_reader = csv.DictReader(file)
-        
-        # In the master.csv, the columns are exactly "Reconfiguration X (Description)"
-        # We need to check all columns that might match our reconfiguration number
-        
-        for row in csv_reader:
-            pixel_number = safe_int(safe_get(row, 'Pixel number'))
-            if not pixel_number:
+def index_reconfiguration_columns(fieldnames):
+    """Precompute the master.csv reconfiguration columns used by each stage"""
+    # Assembly networks match "Reconfiguration X" or "Reconfiguration X ..." by prefix
+    network_columns = {}
+    for header in fieldnames:
+        if not header.startswith('Reconfiguration '):
+            continue
+        token = header[len('Reconfiguration '):].split(' ', 1)[0]
+        if token.isdigit() and str(int(token)) == token:
+            network_columns.setdefault(int(token), []).append(header)
+
+    # Timelines parse the number in front of the "(Description)" part of the header
+    timeline_columns = {}
+    for header in fieldnames:
+        if header.startswith('Reconfiguration'):
+            try:
+                num = int(header.split('(')[0].replace('Reconfiguration', '').strip())
+                timeline_columns[num] = header
+            except (ValueError, IndexError):
                 continue
-            
-            # Check all reconfiguration columns
-            for column in row.keys():
-                if column.startswith(f"Reconfiguration {reconfig_number} ") or column == f"Reconfiguration {reconfig_number}":
-                    if safe_get(row, column, '').strip() == '1':
-                        pixel_network.append(pixel_number)
-                        break  # Found a match, no need to check other columns
-    
-    return pixel_network
 
-def convert_carbon_locations_to_json(csv_file, master_csv):
+    # The pixel summary only looks for bare "Reconfiguration X" headers
+    exact_columns = {}
+    for i in range(1, 16):
+        column_name = f"Reconfiguration {i}"
+        if column_name in fieldnames:
+            exact_columns[i] = column_name
+
+    return {
+        "network": network_columns,
+        "timeline": timeline_columns,
+        "exact": exact_columns
+    }
+
+def load_master_table(csv_file):
+    """Load master.csv once along with its precomputed reconfiguration column mappings"""
+    table = load_csv_table(csv_file)
+    table["reconfiguration_columns"] = index_reconfiguration_columns(table["fieldnames"])
+    return table
+
+def row_networks(row, network_columns):
+    """Yield the number of every reconfiguration whose network the pixel of a master.csv row is part of"""
+    for number, columns in network_columns.items():
+        for column in columns:
+            if safe_get(row, column, '').strip() == '1':
+                yield number
+                break  # Found a match, no need to check other columns
+
+def add_row_to_networks(row, network_columns, pixel_networks):
+    """Append the pixel of a master.csv row to the network of every reconfiguration it is part of"""
+    pixel_number = safe_int(safe_get(row, 'Pixel number'))
+    if not pixel_number:
+        return
+
+    for number in row_networks(row, network_columns):
+        pixel_networks.setdefault(number, []).append(pixel_number)
+
+def extract_reconfiguration_networks(master_table):
+    """Map every reconfiguration number to the pixel numbers that are part of it, in one pass"""
+    network_columns = master_table["reconfiguration_columns"]["network"]
+    pixel_networks = {number: [] for number in network_columns}
+
+    for row in master_table["rows"]:
+        add_row_to_networks(row, network_columns, pixel_networks)
+
+    return pixel_networks
+
+def convert_carbon_locations_to_json(carbon_table, pixel_networks):
     reconfigurations = []
     
-    with open(csv_file, 'r') as file:
-        csv_reader = csv.DictReader(file)
-        for row in csv_reader:
-            # Skip empty rows
-            if not row['Reconfiguration number']:
-                continue
-                
-            # Parse coordinates
-            coords = row['Location coordinates'].replace('° N', '').replace('° W', '').replace('° E', '').split(',')
-            lat = float(coords[0]) if coords[0].strip() else None
-            # Convert West longitude to negative
-            lon = float(coords[1]) if coords[1].strip() else None
-            if 'W' in row['Location coordinates']:
-                lon = -lon if lon else None
-            
-            number = int(row['Reconfiguration number'])
-            
-            # Get the network of pixels for this reconfiguration
-            pixel_network = extract_pixels_for_reconfiguration(master_csv, number)
-            
-            # Calculate total emissions if it's null but we have the necessary values
-            total_emissions = None
-            if row['Total emissions per reconfiguration (kgCO2e/pixel)']:
-                total_emissions = float(row['Total emissions per reconfiguration (kgCO2e/pixel)'])
-            elif row['A1-A3 emissions (kgCO2e)'] and row['Carbon emissions (A4) (kgCO2e/pixel)']:
-                a1_a3 = float(row['A1-A3 emissions (kgCO2e)']) if row['A1-A3 emissions (kgCO2e)'] else 0
-                transport = float(row['Carbon emissions (A4) (kgCO2e/pixel)']) if row['Carbon emissions (A4) (kgCO2e/pixel)'] else 0
-                total_emissions = a1_a3 + transport
-            
-            reconfiguration = {
-                "number": number,
-                "serial": f"{number:04d}",  # Add serial field
-                "name": row['Reconfiguration name'],
-                "description": row['Description'], 
-                "date": row['Date'].strip() if row['Date'] else None,
-                "generation_name": row['Generation name'],
-                "scale": row['Scale'],
-                "location": {
-                    "name": row['Location name'],
-                    "coordinates": {
-                        "latitude": lat,
-                        "longitude": lon
-                    }
-                },
-                "pixel_weight": float(row['Pixel weight (kg)']) if row['Pixel weight (kg)'] else None,
-                "coefficient": float(row['A1-A3 Coefficient']) if row['A1-A3 Coefficient'] else None,
-                "a1_a3_emissions": float(row['A1-A3 emissions (kgCO2e)']) if row['A1-A3 emissions (kgCO2e)'] else None,
-                "transport": {
-                    "distance": float(row['Transport distance (km)']) if row['Transport distance (km)'] else 0,
-                    "type": row['Type of transport'],
-                    "coefficient": float(row['Transport coefficient (kgCO2e/kg)']) if row['Transport coefficient (kgCO2e/kg)'] else None,
-                    "emissions": float(row['Carbon emissions (A4) (kgCO2e/pixel)']) if row['Carbon emissions (A4) (kgCO2e/pixel)'] else 0
-                },
-                "total_emissions": total_emissions,
-                "network": pixel_network  # Add the network of pixels
-            }
-            reconfigurations.append(reconfiguration)
+    for row in carbon_table["rows"]:
+        # Skip empty rows
+        if not row['Reconfiguration number']:
+            continue
             
+        # Parse coordinates
+        coords = row['Location coordinates'].replace('° N', '').replace('° W', '').replace('° E', '').split(',')
+        lat = float(coords[0]) if coords[0].strip() else None
+        # Convert West longitude to negative
+        lon = float(coords[1]) if coords[1].strip() else None
+        if 'W' in row['Location coordinates']:
+            lon = -lon if lon else None
+        
+        number = int(row['Reconfiguration number'])
+        
+        # Get the network of pixels for this reconfiguration
+        pixel_network = list(pixel_networks.get(number, []))
+        
+        # Calculate total emissions if it's null but we have the necessary values
+        total_emissions = None
+        if row['Total emissions per reconfiguration (kgCO2e/pixel)']:
+            total_emissions = float(row['Total emissions per reconfiguration (kgCO2e/pixel)'])
+        elif row['A1-A3 emissions (kgCO2e)'] and row['Carbon emissions (A4) (kgCO2e/pixel)']:
+            a1_a3 = float(row['A1-A3 emissions (kgCO2e)']) if row['A1-A3 emissions (kgCO2e)'] else 0
+            transport = float(row['Carbon emissions (A4) (kgCO2e/pixel)']) if row['Carbon emissions (A4) (kgCO2e/pixel)'] else 0
+            total_emissions = a1_a3 + transport
+        
+        reconfiguration = {
+            "number": number,
+            "serial": f"{number:04d}",  # Add serial field
+            "name": row['Reconfiguration name'],
+            "description": row['Description'], 
+            "date": row['Date'].strip() if row['Date'] else None,
+            "generation_name": row['Generation name'],
+            "scale": row['Scale'],
+            "location": {
+                "name": row['Location name'],
+                "coordinates": {
+                    "latitude": lat,
+                    "longitude": lon
+                }
+            },
+            "pixel_weight": float(row['Pixel weight (kg)']) if row['Pixel weight (kg)'] else None,
+            "coefficient": float(row['A1-A3 Coefficient']) if row['A1-A3 Coefficient'] else None,
+            "a1_a3_emissions": float(row['A1-A3 emissions (kgCO2e)']) if row['A1-A3 emissions (kgCO2e)'] else None,
+            "transport": {
+                "distance": float(row['Transport distance (km)']) if row['Transport distance (km)'] else 0,
+                "type": row['Type of transport'],
+                "coefficient": float(row['Transport coefficient (kgCO2e/kg)']) if row['Transport coefficient (kgCO2e/kg)'] else None,
+                "emissions": float(row['Carbon emissions (A4) (kgCO2e/pixel)']) if row['Carbon emissions (A4) (kgCO2e/pixel)'] else 0
+            },
+            "total_emissions": total_emissions,
+            "network": pixel_network  # Add the network of pixels
+        }
+        reconfigurations.append(reconfiguration)
+        
     return {"reconfigurations": reconfigurations}
 
-def convert_master_to_json(csv_file, generation_descriptions, state_legend, reconfig_columns):
+def convert_master_row(row, exact_columns, generation_descriptions, state_legend):
+    """Convert a single master.csv row into a pixel record, or None if it has no pixel number"""
+    if not safe_get(row, 'Pixel number'):
+        return None
+        
+    reconfigurations = {}
+    for i, column_name in exact_columns.items():
+        value = safe_get(row, column_name, '').strip()
+        # Convert to boolean - "1" means true, anything else is false
+        reconfigurations[str(i)] = value == "1"
+    
+    generation = safe_int(safe_get(row, 'Generation'))
+    state = safe_int(safe_get(row, 'State'))
+    
+    return Pixel(
+        pixel_number=safe_int(safe_get(row, 'Pixel number')),
+        generation=generation,
+        generation_description=generation_descriptions.get(generation) if generation else None,
+        state_description=state_legend.get(state) if state else None,
+        state=state,
+        fc=safe_float(safe_get(row, "fc'")),
+        weight=safe_float(safe_get(row, 'Weight (kg)')),
+        concrete_mix=safe_get(row, 'Concrete mix', '').strip() or None,
+        fiber_type=safe_get(row, 'Fiber type', '').strip() or None,
+        fiber_dosage=safe_get(row, 'Fiber dosage', '').strip() or None,
+        date_of_manufacture=safe_get(row, 'Date of manufacture'),
+        number_of_reconfigurations=safe_int(safe_get(row, 'Number of reconfigurations at present')),
+        reconfigurations=reconfigurations,
+        gif=safe_get(row, 'GIF', '').lower() == 'yes',
+        notes=safe_get(row, 'notes')
+    )
+
+def convert_master_to_json(master_table, generation_descriptions, state_legend):
     pixels = []
+    exact_columns = master_table["reconfiguration_columns"]["exact"]
     
-    with open(csv_file, 'r') as file:
-        csv_reader = csv.DictReader(file)
-        for row in csv_reader:
-            if not safe_get(row, 'Pixel number'):
-                continue
-                
-            reconfigurations = {}
-            for i in range(1, 16):
-                # Check if the column exists in the CSV
-                column_name = f"Reconfiguration {i}"
-                if column_name in row:
-                    value = safe_get(row, column_name, '').strip()
-                    # Convert to boolean - "1" means true, anything else is false
-                    reconfigurations[str(i)] = value == "1"
-            
-            generation = safe_int(safe_get(row, 'Generation'))
-            state = safe_int(safe_get(row, 'State'))
-            
-            pixel = {
-                "pixel_number": safe_int(safe_get(row, 'Pixel number')),
-                "generation": generation,
-                "generation_description": generation_descriptions.get(generation) if generation else None,
-                "state_description": state_legend.get(state) if state else None,
-                "state": state,
-                "fc": safe_float(safe_get(row, "fc'")),
-                "weight": safe_float(safe_get(row, 'Weight (kg)')),
-                "carbon_emissions_a1_a3": None,
-                "concrete_mix": safe_get(row, 'Concrete mix', '').strip() or None,
-                "fiber": {
-                    "type": safe_get(row, 'Fiber type', '').strip() or None,
-                    "dosage": safe_get(row, 'Fiber dosage', '').strip() or None
-                },
-                "date_of_manufacture": safe_get(row, 'Date of manufacture'),
-                "number_of_reconfigurations": safe_int(safe_get(row, 'Number of reconfigurations at present')),
-                "reconfigurations": reconfigurations,
-                "gif": safe_get(row, 'GIF', '').lower() == 'yes',
-                "notes": safe_get(row, 'notes')
-            }
+    for row in master_table["rows"]:
+        pixel = convert_master_row(row, exact_columns, generation_descriptions, state_legend)
+        if pixel is not None:
             pixels.append(pixel)
     
     return {"pixels": pixels}
 
-def create_timeline_json(master_csv, carbon_locations_csv):
+def build_carbon_lookup(carbon_table):
+    """Index the carbon_location.csv table by reconfiguration number as Reconfiguration records"""
     carbon_data = {}
-    with open(carbon_locations_csv, 'r') as file:
-        csv_reader = csv.DictReader(file)
-        for row in csv_reader:
-            reconfig_num = safe_int(safe_get(row, 'Reconfiguration number'))
-            if not reconfig_num:
-                continue
-                
-            carbon_data[reconfig_num] = {
-                'name': safe_get(row, 'Reconfiguration name'),
-                'description': safe_get(row, 'Description'),
-                'date': safe_get(row, 'Date'),
-                'location': {
-                    'name': safe_get(row, 'Location name'),
-                    'coordinates': {
-                        'latitude': safe_float(safe_get(row, 'Location coordinates', '').split('° N')[0]),
-                        'longitude': safe_float(safe_get(row, 'Location coordinates', '').split(',')[1].replace('° W', '').replace('° E', '').strip()) * 
-                            (-1 if '° W' in safe_get(row, 'Location coordinates', '') else 1)
-                    }
-                },
-                'transport': {
-                    'type': safe_get(row, 'Type of transport'),
-                    'distance': safe_float(safe_get(row, 'Transport distance (km)'), 0),
-                    'emissions': safe_float(safe_get(row, 'Carbon emissions (A4) (kgCO2e/pixel)'), 0)
-                },
-                'a1_a3_emissions': safe_float(safe_get(row, 'A1-A3 emissions (kgCO2e)'), 0)
-            }
+    for row in carbon_table["rows"]:
+        reconfig_num = safe_int(safe_get(row, 'Reconfiguration number'))
+        if not reconfig_num:
+            continue
+            
+        carbon_data[reconfig_num] = Reconfiguration(
+            name=safe_get(row, 'Reconfiguration name'),
+            description=safe_get(row, 'Description'),
+            date=safe_get(row, 'Date'),
+            location=Location(
+                name=safe_get(row, 'Location name'),
+                latitude=safe_float(safe_get(row, 'Location coordinates', '').split('° N')[0]),
+                longitude=safe_float(safe_get(row, 'Location coordinates', '').split(',')[1].replace('° W', '').replace('° E', '').strip()) * 
+                    (-1 if '° W' in safe_get(row, 'Location coordinates', '') else 1)
+            ),
+            transport_type=safe_get(row, 'Type of transport'),
+            transport_distance=safe_float(safe_get(row, 'Transport distance (km)'), 0),
+            transport_emissions=safe_float(safe_get(row, 'Carbon emissions (A4) (kgCO2e/pixel)'), 0),
+            a1_a3_emissions=safe_float(safe_get(row, 'A1-A3 emissions (kgCO2e)'), 0)
+        )
+    return carbon_data
 
-    pixels_timeline = []
-    with open(master_csv, 'r') as file:
-        csv_reader = csv.DictReader(file)
-        column_headers = csv_reader.fieldnames
-        
-        reconfig_columns = {}
-        for header in column_headers:
-            if header.startswith('Reconfiguration'):
-                try:
-                    num = int(header.split('(')[0].replace('Reconfiguration', '').strip())
-                    reconfig_columns[num] = header
-                except (ValueError, IndexError):
-                    continue
+FABRICATION_SITE = Location(name="Fabrication Site", latitude=None, longitude=None)
 
-        for row in csv_reader:
-            pixel_number = safe_int(safe_get(row, 'Pixel number'))
-            if not pixel_number:
-                continue
+def create_pixel_timeline(row, reconfig_columns, carbon_data):
+    """Build the fabrication and reconfiguration timeline of a single master.csv row, or None if it is empty"""
+    pixel_number = safe_int(safe_get(row, 'Pixel number'))
+    if not pixel_number:
+        return None
 
-            reconfigurations = []
-            for num, column in reconfig_columns.items():
-                if safe_get(row, column, '').strip() == '1':
-                    reconfigurations.append(num)
+    reconfigurations = []
+    for num, column in reconfig_columns.items():
+        if safe_get(row, column, '').strip() == '1':
+            reconfigurations.append(num)
 
-            # Create timeline starting with fabrication step
-            timeline = []
-            cumulative_emissions = 0
-            cumulative_distance = 0
-            
-            # Add fabrication step as the first timeline entry
-            manufacture_year = safe_get(row, 'Date of manufacture')
-            if manufacture_year:
-                fabrication_date = f"January {manufacture_year}"
-                
-                # Get the A1-A3 emissions from the first reconfiguration if available
-                a1_a3_emissions = 0
-                if reconfigurations and reconfigurations[0] in carbon_data:
-                    a1_a3_emissions = carbon_data[reconfigurations[0]]['a1_a3_emissions']
-                
-                # Create the fabrication timeline entry
-                fabrication_entry = {
-                    "step": 1,
-                    "reconfiguration_number": 0,  # 0 indicates fabrication step
-                    "name": "Initial Fabrication",
-                    "date": fabrication_date,
-                    "location": {
-                        "name": "Fabrication Site",
-                        "coordinates": {
-                            "latitude": None,
-                            "longitude": None
-                        }
-                    },
-                    "emissions": {
-                        "a1_a3": a1_a3_emissions,
-                        "transport": 0,
-                        "step_total": a1_a3_emissions,
-                        "running_total": a1_a3_emissions
-                    },
-                    "transport": {
-                        "type": None,
-                        "distance": 0,
-                        "cumulative_distance": 0
-                    },
-                    "description": f"Generation {safe_get(row, 'Generation')} pixel fabrication"
-                }
-                
-                timeline.append(fabrication_entry)
-                cumulative_emissions = a1_a3_emissions
+    # Create timeline starting with fabrication step
+    timeline = []
+    cumulative_emissions = 0
+    cumulative_distance = 0
+    
+    # Add fabrication step as the first timeline entry
+    manufacture_year = safe_get(row, 'Date of manufacture')
+    if manufacture_year:
+        fabrication_date = f"January {manufacture_year}"
+        
+        # Get the A1-A3 emissions from the first reconfiguration if available
+        a1_a3_emissions = 0
+        if reconfigurations and reconfigurations[0] in carbon_data:
+            a1_a3_emissions = carbon_data[reconfigurations[0]].a1_a3_emissions
+        
+        # Create the fabrication timeline entry; 0 as reconfiguration number indicates fabrication
+        fabrication_entry = TimelineStep(
+            step=1,
+            reconfiguration_number=0,
+            name="Initial Fabrication",
+            date=fabrication_date,
+            location=FABRICATION_SITE,
+            a1_a3=a1_a3_emissions,
+            transport_emissions=0,
+            step_total=a1_a3_emissions,
+            running_total=a1_a3_emissions,
+            transport_type=None,
+            distance=0,
+            cumulative_distance=0,
+            description=f"Generation {safe_get(row, 'Generation')} pixel fabrication"
+        )
+        
+        timeline.append(fabrication_entry)
+        cumulative_emissions = a1_a3_emissions
+    
+    # Add subsequent reconfiguration steps
+    for step, reconfig_num in enumerate(reconfigurations, len(timeline) + 1):
+        if reconfig_num not in carbon_data:
+            continue
             
-            # Add subsequent reconfiguration steps
-            for step, reconfig_num in enumerate(reconfigurations, len(timeline) + 1):
-                if reconfig_num not in carbon_data:
-                    continue
-                    
-                reconfig_data = carbon_data[reconfig_num]
-                
-                # A1-A3 emissions only counted in fabrication step now
-                a1_a3 = 0
-                transport_emissions = reconfig_data['transport']['emissions']
-                step_distance = reconfig_data['transport']['distance']
-                
-                cumulative_emissions += transport_emissions
-                cumulative_distance += step_distance
-
-                timeline_entry = {
-                    "step": step,
-                    "reconfiguration_number": reconfig_num,
-                    "name": reconfig_data['name'],
-                    "date": reconfig_data['date'],
-                    "location": reconfig_data['location'],
-                    "emissions": {
-                        "a1_a3": a1_a3,
-                        "transport": transport_emissions,
-                        "step_total": transport_emissions,
-                        "running_total": cumulative_emissions
-                    },
-                    "transport": {
-                        "type": reconfig_data['transport']['type'],
-                        "distance": step_distance,
-                        "cumulative_distance": cumulative_distance
-                    },
-                    "description": reconfig_data['description']
-                }
-                timeline.append(timeline_entry)
-
-            if timeline:
-                pixel_timeline = {
-                    "pixel_number": pixel_number,
-                    "timeline": timeline,
-                    "total_emissions": cumulative_emissions,
-                    "total_distance": cumulative_distance
-                }
-                pixels_timeline.append(pixel_timeline)
+        reconfig_data = carbon_data[reconfig_num]
+        
+        # A1-A3 emissions only counted in fabrication step now
+        a1_a3 = 0
+        transport_emissions = reconfig_data.transport_emissions
+        step_distance = reconfig_data.transport_distance
+        
+        cumulative_emissions += transport_emissions
+        cumulative_distance += step_distance
 
-    return {"pixels": pixels_timeline}
+        timeline_entry = TimelineStep(
+            step=step,
+            reconfiguration_number=reconfig_num,
+            name=reconfig_data.name,
+            date=reconfig_data.date,
+            location=reconfig_data.location,
+            a1_a3=a1_a3,
+            transport_emissions=transport_emissions,
+            step_total=transport_emissions,
+            running_total=cumulative_emissions,
+            transport_type=reconfig_data.transport_type,
+            distance=step_distance,
+            cumulative_distance=cumulative_distance,
+            description=reconfig_data.description
+        )
+        timeline.append(timeline_entry)
 
-def create_individual_pixel_files(master_data, timeline_data):
-    """Create individual JSON files for each pixel with combined data"""
-    pixel_files = {}
+    if not timeline:
+        return None
+    return PixelTimeline(
+        pixel_number=pixel_number,
+        steps=timeline,
+        total_emissions=cumulative_emissions,
+        total_distance=cumulative_distance
+    )
+
+def create_timeline_json(master_table, carbon_table):
+    carbon_data = build_carbon_lookup(carbon_table)
+    reconfig_columns = master_table["reconfiguration_columns"]["timeline"]
+
+    pixels_timeline = []
+    # The timeline (or None) of every row convert_master_to_json makes a pixel record of, in its order
+    rows = []
+    for row in master_table["rows"]:
+        pixel_timeline = create_pixel_timeline(row, reconfig_columns, carbon_data)
+        if pixel_timeline is not None:
+            pixels_timeline.append(pixel_timeline)
+        if safe_get(row, 'Pixel number'):
+            rows.append(pixel_timeline)
+
+    return {"pixels": pixels_timeline, "rows": rows}
+
+def pixel_records(master_data, timeline_data):
+    """Pair every pixel record with the timeline of its own master.csv row, or None.
+
+    A pixel number on several rows gets a record per row, each with that row's timeline. Where a
+    single entry per pixel number is kept (the pixel files, the SQLite export, the per-reconfiguration
+    aggregates) the last row wins. The streaming build follows the same rule.
+    """
+    return zip(master_data["pixels"], timeline_data["rows"])
+
+def create_pixel_file(pixel, pixel_timeline):
+    """Combine a pixel record with its timeline (or None) into the data of its pixel_XXXX.json file"""
+    pixel_number = pixel.pixel_number
     
-    # Create a lookup for timeline data by pixel_number
-    timeline_lookup = {pixel["pixel_number"]: pixel for pixel in timeline_data["pixels"]}
+    pixel_data = pixel.to_dict()
+    # Add the serialized identifier
+    pixel_data["serial"] = f"{pixel_number:04d}"
     
-    for pixel in master_data["pixels"]:
-        pixel_number = pixel["pixel_number"]
-        
-        # Create a deep copy of the pixel data
-        pixel_data = dict(pixel)
-        # Add the serialized identifier
-        pixel_data["serial"] = f"{pixel_number:04d}"
-        
-        # Add timeline data if available
-        if pixel_number in timeline_lookup:
-            pixel_data["timeline"] = timeline_lookup[pixel_number]["timeline"]
-            pixel_data["total_emissions"] = timeline_lookup[pixel_number]["total_emissions"]
-            pixel_data["total_distance"] = timeline_lookup[pixel_number]["total_distance"]
-        else:
-            pixel_data["timeline"] = []
-            pixel_data["total_emissions"] = 0
-            pixel_data["total_distance"] = 0
+    # Add timeline data if available
+    if pixel_timeline is not None:
+        pixel_data["timeline"] = [step.to_dict() for step in pixel_timeline.steps]
+        pixel_data["total_emissions"] = pixel_timeline.total_emissions
+        pixel_data["total_distance"] = pixel_timeline.total_distance
+    else:
+        pixel_data["timeline"] = []
+        pixel_data["total_emissions"] = 0
+        pixel_data["total_distance"] = 0
+    
+    return pixel_data
+
+def create_individual_pixel_files(master_data, timeline_data, serials=None):
+    """Create individual JSON files for each pixel with combined data, optionally only for the given serials"""
+    pixel_files = {}
+    
+    for pixel, pixel_timeline in pixel_records(master_data, timeline_data):
+        pixel_number = pixel.pixel_number
+        if serials is not None and f"{pixel_number:04d}" not in serials:
+            continue
             
         # Store pixel data with padded number as key
-        pixel_files[f"{pixel_number:04d}"] = pixel_data
+        pixel_files[f"{pixel_number:04d}"] = create_pixel_file(pixel, pixel_timeline)
         
     return pixel_files
 
+def simplify_pixel(pixel, pixel_timeline):
+    """Reduce a pixel record and its timeline (or None) to the entry listed in pixels.json"""
+    # Get timeline data if available
+    total_distance = 0
+    total_emissions = 0
+    emissions_over_time = {}
+    
+    if pixel_timeline is not None:
+        total_distance = pixel_timeline.total_distance
+        total_emissions = pixel_timeline.total_emissions
+        
+        # Create emissions over time dictionary
+        for entry in pixel_timeline.steps:
+            if entry.date:
+                # Use the date as key and running total as value
+                emissions_over_time[entry.date] = entry.running_total
+    
+    return {
+        "pixel_number": pixel.pixel_number,
+        "serial": f"{pixel.pixel_number:04d}",  # Add serial field
+        "generation": pixel.generation,
+        "state": pixel.state,
+        "state_description": pixel.state_description,
+        "number_of_reconfigurations": pixel.number_of_reconfigurations,
+        "distance_traveled": total_distance,
+        "date_of_manufacture": pixel.date_of_manufacture,
+        "total_emissions": total_emissions,
+        "emissions_over_time": emissions_over_time
+    }
+
 def create_simplified_pixels_json(master_data, timeline_data):
     """Create a simplified pixels.json with basic status information"""
-    simplified_pixels = []
+    simplified_pixels = [
+        simplify_pixel(pixel, pixel_timeline)
+        for pixel, pixel_timeline in pixel_records(master_data, timeline_data)
+    ]
+        
+    return {"pixels": simplified_pixels}
+
+PIXEL_PAGE_SIZE = 50
+
+def describe_pixel_page(page_number, offset, entries):
+    """Summarize one page of pixels.json entries for the pages index"""
+    numbers = [entry["pixel_number"] for entry in entries if entry["pixel_number"] is not None]
+    return {
+        "page": page_number,
+        "file": f"page_{page_number:04d}.json",
+        "offset": offset,
+        "count": len(entries),
+        "first_serial": entries[0]["serial"],
+        "last_serial": entries[-1]["serial"],
+        "min_pixel_number": min(numbers, default=None),
+        "max_pixel_number": max(numbers, default=None)
+    }
+
+def stream_pixel_pages(entries, write, page_size=PIXEL_PAGE_SIZE, pages=None):
+    """Pass pixels.json entries through unchanged while handing them to write(relative_path, data)
+    as fixed-size pages, followed by the pages index once the entries run out.
+
+    Pages keep the order of pixels.json, so listing views can render the first page and fetch the
+    rest lazily; the index gives the total count and the serial and pixel number range of each page.
+    The page descriptions of the index are appended to pages, a new list unless one is given.
+    """
+    pages = [] if pages is None else pages
+    page_number = 0
+    offset = 0
+    page = []
     
-    # Create a lookup for timeline data by pixel_number
-    timeline_lookup = {pixel["pixel_number"]: pixel for pixel in timeline_data["pixels"]}
+    def flush():
+        pages.append(describe_pixel_page(page_number, offset, page))
+        write(f"pixels/page_{page_number:04d}.json", {"pixels": page})
     
-    for pixel in master_data["pixels"]:
-        pixel_number = pixel["pixel_number"]
-        
-        # Get timeline data if available
-        total_distance = 0
-        total_emissions = 0
-        emissions_over_time = {}
-        
-        if pixel_number in timeline_lookup:
-            total_distance = timeline_lookup[pixel_number]["total_distance"]
-            total_emissions = timeline_lookup[pixel_number]["total_emissions"]
-            
-            # Create emissions over time dictionary
-            for entry in timeline_lookup[pixel_number]["timeline"]:
-                if entry["date"]:
-                    # Use the date as key and running total as value
-                    emissions_over_time[entry["date"]] = entry["emissions"]["running_total"]
-        
-        simplified_pixel = {
-            "pixel_number": pixel["pixel_number"],
-            "serial": f"{pixel['pixel_number']:04d}",  # Add serial field
-            "generation": pixel["generation"],
-            "state": pixel["state"],
-            "state_description": pixel["state_description"],
-            "number_of_reconfigurations": pixel["number_of_reconfigurations"],
-            "distance_traveled": total_distance,
-            "date_of_manufacture": pixel["date_of_manufacture"],
-            "total_emissions": total_emissions,
-            "emissions_over_time": emissions_over_time
-        }
-        simplified_pixels.append(simplified_pixel)
+    for entry in entries:
+        page.append(entry)
+        yield entry
+        if len(page) == page_size:
+            flush()
+            page_number += 1
+            offset += len(page)
+            page = []
+    if page:
+        flush()
+        offset += len(page)
+    
+    write("pixels/index.json", {
+        "total": offset,
+        "page_size": page_size,
+        "order": "pixels.json",
+        "pages": pages
+    })
+
+def create_pixel_pages(simplified_pixels, page_size=PIXEL_PAGE_SIZE):
+    """Split the simplified pixels.json data into pages, returned as {relative_path: data}"""
+    pages = {}
+    deque(stream_pixel_pages(simplified_pixels["pixels"], pages.__setitem__, page_size), maxlen=0)
+    return pages
+
+def new_filter_indexes():
+    """Create empty inverted indexes for add_to_filter_indexes; pixel numbers are kept in compact
+    arrays of 8 bytes each"""
+    return {"state": {}, "generation": {}, "pixels": array('q')}
+
+def add_to_filter_indexes(indexes, entry):
+    """Record a pixels.json entry under its state and generation"""
+    pixel_number = entry["pixel_number"]
+    if pixel_number is None:
+        return
+    indexes["pixels"].append(pixel_number)
+    for key in ("state", "generation"):
+        if entry[key] is not None:
+            indexes[key].setdefault(entry[key], array('q')).append(pixel_number)
+
+def iter_filter_index_files(indexes, pixel_networks):
+    """Yield the (relative_path, data) of every index file of create_filter_index_files, building
+    each only when it is asked for, so a caller writing them one by one holds a single one"""
+    def sorted_index(mapping):
+        return {str(key): sorted(set(values)) for key, values in sorted(mapping.items())}
+    
+    yield "index/state.json", sorted_index(indexes["state"])
+    yield "index/generation.json", sorted_index(indexes["generation"])
+    yield "index/reconfiguration.json", sorted_index(pixel_networks)
+    
+    pixel_reconfigurations = {}
+    for number, network in sorted(pixel_networks.items()):
+        for pixel_number in network:
+            pixel_reconfigurations.setdefault(pixel_number, []).append(number)
+    yield "index/pixel_reconfigurations.json", {
+        str(pixel_number): sorted(set(pixel_reconfigurations.get(pixel_number, ())))
+        for pixel_number in sorted(set(indexes["pixels"]).union(pixel_reconfigurations))
+    }
+
+def create_filter_index_files(indexes, pixel_networks):
+    """Turn the collected filter indexes and the reconfiguration networks into compact
+    inverted index files, returned as {relative_path: data}.
+
+    Each file maps a filter value to the sorted pixel numbers matching it, so a filter view can
+    resolve a query with one small fetch instead of scanning pixels.json or assemblies.json.
+    """
+    return dict(iter_filter_index_files(indexes, pixel_networks))
+
+def create_filter_indexes(simplified_pixels, pixel_networks):
+    """Build the inverted index files for the simplified pixels.json data"""
+    indexes = new_filter_indexes()
+    for entry in simplified_pixels["pixels"]:
+        add_to_filter_indexes(indexes, entry)
+    return create_filter_index_files(indexes, pixel_networks)
+
+def remove_stale_pixel_pages(output_base_path, page_count):
+    """Remove page files left over from a build that produced more than page_count pages, returning
+    their relative paths"""
+    removed = []
+    pages_dir = f'{output_base_path}/pixels'
+    if not os.path.isdir(pages_dir):
+        return removed
+    for filename in sorted(os.listdir(pages_dir)):
+        relative_path = f'pixels/{filename}'
+        match = re.fullmatch(r'page_(\d+)\.json', filename)
+        if match and int(match.group(1)) >= page_count:
+            os.remove(f'{pages_dir}/{filename}')
+            removed.append(relative_path)
+    return removed
+
+def read_csv_header(csv_file):
+    """Read only the header row of a CSV file"""
+    with open(csv_file, 'r') as file:
+        return next(csv.reader(file), [])
+
+def iter_csv_rows(csv_file):
+    """Yield the rows of a CSV file one at a time without keeping them in memory"""
+    count = 0
+    with open(csv_file, 'r') as file:
+        for row in csv.DictReader(file):
+            count += 1
+            yield row
+    record_rows(csv_file, count)
+
+def stream_pixel_records(master_csv, reconfiguration_columns, carbon_data, generation_descriptions, state_legend,
+                         spill):
+    """Yield (pixel, timeline) pairs row by row from master.csv, spilling the network memberships
+    of every row on the way"""
+    for row in iter_csv_rows(master_csv):
+        pixel_number = safe_int(safe_get(row, 'Pixel number'))
+        if pixel_number:
+            spill.executemany('INSERT INTO network_rows VALUES (?, ?)', (
+                (number, pixel_number) for number in row_networks(row, reconfiguration_columns["network"])
+            ))
+        pixel = convert_master_row(row, reconfiguration_columns["exact"], generation_descriptions, state_legend)
+        if pixel is None:
+            continue
+        yield pixel, create_pixel_timeline(row, reconfiguration_columns["timeline"], carbon_data)
+
+def stream_pixel_files(records, pixel_dir, output_format='pretty'):
+    """Write each pixel_XXXX.json as soon as its record arrives and yield its pixels.json entry"""
+    for pixel, pixel_timeline in records:
+        pixel_data = create_pixel_file(pixel, pixel_timeline)
+        write_json_atomic(f'{pixel_dir}/pixel_{pixel_data["serial"]}.json', pixel_data, output_format)
+        yield simplify_pixel(pixel, pixel_timeline)
+
+# What the streaming build needs of every master.csv row after its first pass, spilled to a temporary
+# database. The columns have no types, so every value reads back exactly as it was written, and rows
+# keep the order of master.csv in their rowid.
+SPILL_SCHEMA = """
+CREATE TABLE pixel_rows (position INTEGER PRIMARY KEY, pixel_number, generation, state, emissions, distance);
+CREATE TABLE network_rows (reconfiguration_number, pixel_number);
+CREATE TABLE route_rows (position INTEGER PRIMARY KEY, pixel_number, legs);
+CREATE TABLE page_rows (position INTEGER PRIMARY KEY, page);
+"""
+SPILL_INDEXES = (
+    'CREATE INDEX pixel_rows_generation ON pixel_rows (generation, pixel_number)',
+    'CREATE INDEX pixel_rows_state ON pixel_rows (state, pixel_number)',
+    'CREATE INDEX network_rows_reconfiguration ON network_rows (reconfiguration_number, pixel_number)',
+    'CREATE INDEX network_rows_pixel ON network_rows (pixel_number, reconfiguration_number)',
+    # Like the pixel files, a duplicate pixel number resolves to its last row
+    'CREATE TABLE last_rows AS SELECT pixel_number, MAX(position) AS position FROM pixel_rows GROUP BY pixel_number',
+    'CREATE INDEX last_rows_pixel ON last_rows (pixel_number)',
+    'CREATE INDEX route_rows_pixel ON route_rows (pixel_number, position)'
+)
+
+def open_spill():
+    """Open a private temporary database, which SQLite keeps on disk once it outgrows its small page
+    cache and deletes when it is closed"""
+    spill = sqlite3.connect('', isolation_level=None)
+    spill.execute('PRAGMA temp_store = FILE')
+    spill.executescript(SPILL_SCHEMA)
+    spill.execute('BEGIN')
+    return spill
+
+def finish_spill(spill):
+    """Index and commit the spilled rows once master.csv has been fully read"""
+    for statement in SPILL_INDEXES:
+        spill.execute(statement)
+    spill.execute('COMMIT')
+
+class SpilledArray(StreamedArray):
+    """A JSON array whose items are appended to page_rows and only read back while it is written"""
+    def __init__(self, spill):
+        self.spill = spill
+    
+    def append(self, item):
+        self.spill.execute('INSERT INTO page_rows (page) VALUES (?)', (json.dumps(item),))
+    
+    @property
+    def items(self):
+        return (json.loads(page) for (page,) in self.spill.execute('SELECT page FROM page_rows ORDER BY position'))
+
+def stream_spill(records, spill, rollup, routes):
+    """Pass (pixel, timeline) records through unchanged while spilling what the aggregates and the
+    routes need of them. Only the dated series of the rollup and the unique legs, assemblies and
+    distance checks of the routes are filled in, none of which grow with the pixel count."""
+    for pixel, pixel_timeline in records:
+        spill.execute('INSERT INTO pixel_rows (pixel_number, generation, state, emissions, distance) VALUES (?, ?, ?, ?, ?)', (
+            pixel.pixel_number, pixel.generation, pixel.state,
+            float(pixel_timeline.total_emissions) if pixel_timeline is not None else 0.0,
+            float(pixel_timeline.total_distance) if pixel_timeline is not None else 0.0
+        ))
+        add_dated_steps(rollup, pixel_timeline)
+        if pixel_timeline is not None:
+            spill.execute('INSERT INTO route_rows (pixel_number, legs) VALUES (?, ?)',
+                          (pixel_timeline.pixel_number, json.dumps(add_pixel_legs(routes, pixel_timeline))))
+        yield pixel, pixel_timeline
+
+def spilled_network(spill, number):
+    """Yield the pixel numbers of a reconfiguration network in master.csv order, duplicates included"""
+    rows = spill.execute('SELECT pixel_number FROM network_rows WHERE reconfiguration_number = ? ORDER BY rowid',
+                         (number,))
+    for (pixel_number,) in rows:
+        yield pixel_number
+
+def spilled_aggregates(spill, rollup, network_numbers):
+    """The aggregates.json data of create_aggregates_from_rollup, summarizing the spilled pixel rows
+    in the order SQLite sorts them"""
+    def summarize(condition='', parameters=()):
+        summary = {}
+        for column in ('emissions', 'distance'):
+            query = f'SELECT {column} FROM pixel_rows {condition}'
+            (count,) = spill.execute(f'SELECT COUNT(*) FROM ({query})', parameters).fetchone()
+            rows = spill.execute(f'{query} ORDER BY {column}', parameters)
+            summary[column] = summarize_ordered(count, (value for (value,) in rows))
+        return summary
+    
+    def summarize_by(key):
+        values = spill.execute(f'SELECT DISTINCT {key} FROM pixel_rows WHERE {key} IS NOT NULL ORDER BY {key}')
+        return {str(value): summarize(f'WHERE {key} = ?', (value,)) for (value,) in values.fetchall()}
+    
+    by_reconfiguration = {
+        str(number): summarize('WHERE position IN (SELECT position FROM last_rows WHERE pixel_number IN '
+                               '(SELECT pixel_number FROM network_rows WHERE reconfiguration_number = ?))', (number,))
+        for number in network_numbers
+    }
+    return assemble_aggregates(summarize(), summarize_by('generation'), summarize_by('state'),
+                               by_reconfiguration, rollup)
+
+def spilled_filter_index_files(spill, network_numbers):
+    """Yield the (relative_path, data) of every index file of create_filter_index_files, read back
+    from the spill while each is written"""
+    def grouped(rows):
+        return StreamedObject(
+            (str(key), StreamedArray(pixel_number for _, pixel_number in group))
+            for key, group in groupby(rows, key=itemgetter(0))
+        )
+    
+    for key in ('state', 'generation'):
+        yield f"index/{key}.json", grouped(spill.execute(
+            f'SELECT DISTINCT {key}, pixel_number FROM pixel_rows '
+            f'WHERE {key} IS NOT NULL AND pixel_number IS NOT NULL ORDER BY {key}, pixel_number'
+        ))
+    yield "index/reconfiguration.json", StreamedObject(
+        (str(number), StreamedArray(pixel_number for _, pixel_number in spill.execute(
+            'SELECT DISTINCT reconfiguration_number, pixel_number FROM network_rows '
+            'WHERE reconfiguration_number = ? ORDER BY pixel_number', (number,)
+        )))
+        for number in network_numbers
+    )
+    rows = spill.execute("""
+        SELECT pixels.pixel_number, networks.reconfiguration_number
+        FROM (SELECT pixel_number FROM pixel_rows WHERE pixel_number IS NOT NULL
+              UNION SELECT pixel_number FROM network_rows) AS pixels
+        LEFT JOIN (SELECT DISTINCT pixel_number, reconfiguration_number FROM network_rows) AS networks
+        ON networks.pixel_number = pixels.pixel_number
+        ORDER BY pixels.pixel_number, networks.reconfiguration_number
+    """)
+    yield "index/pixel_reconfigurations.json", StreamedObject(
+        (str(pixel_number), [number for _, number in group if number is not None])
+        for pixel_number, group in groupby(rows, key=itemgetter(0))
+    )
+
+def spilled_route_pixels(spill):
+    """The legs of every pixel for create_routes_from_table: a duplicate pixel number keeps its
+    first position and its last legs, like the pixel files"""
+    rows = spill.execute("""
+        SELECT route_rows.pixel_number, route_rows.legs
+        FROM (SELECT MIN(position) AS first, MAX(position) AS last FROM route_rows GROUP BY pixel_number) AS pixels
+        JOIN route_rows ON route_rows.position = pixels.last
+        ORDER BY pixels.first
+    """)
+    return StreamedObject((f"{pixel_number:04d}", json.loads(legs)) for pixel_number, legs in rows)
+
+def write_bank_streaming(base_path, output_base_path, generation_descriptions, state_legend, output_format='pretty',
+                         page_size=PIXEL_PAGE_SIZE, sqlite_path=None):
+    """Build the bank in two passes whose memory does not grow with the pixel count.
+
+    The first pass reads master.csv row by row, writes every pixel file, pixels.json and its pages
+    and fills in the SQLite export as it goes, and spills what the other files need of each row to
+    a temporary database. The second pass writes assemblies.json, the aggregates, the indexes and
+    the routes from that database, sorted and grouped by SQLite and encoded while they are read back.
+    Only the carbon_location.csv lookup, the fleet-wide totals per date and the unique route legs
+    stay in memory.
+    """
+    carbon_table = load_csv_table(f'{base_path}/carbon_location.csv')
+    carbon_data = build_carbon_lookup(carbon_table)
+    master_csv = f'{base_path}/master.csv'
+    reconfiguration_columns = index_reconfiguration_columns(read_csv_header(master_csv))
+    network_numbers = sorted(reconfiguration_columns["network"])
+    spill = open_spill()
+    export = open_sqlite_export(sqlite_path) if sqlite_path else None
+    
+    def write_page(relative_path, data):
+        write_json_chunked(f'{output_base_path}/{relative_path}', data, output_format)
+    
+    try:
+        rollup = new_rollup()
+        routes = new_routes()
+        records = stream_pixel_records(master_csv, reconfiguration_columns, carbon_data,
+                                       generation_descriptions, state_legend, spill)
+        records = stream_spill(records, spill, rollup, routes)
+        if export is not None:
+            records = stream_sqlite(records, export)
+        entries = stream_pixel_files(records, f'{output_base_path}/pixel', output_format)
+        entries = stream_pixel_pages(entries, write_page, page_size, SpilledArray(spill))
+        write_json_chunked(f'{output_base_path}/pixel/pixels.json', {"pixels": StreamedArray(entries)}, output_format)
+        finish_spill(spill)
         
-    return {"pixels": simplified_pixels}
+        carbon_locations_data = convert_carbon_locations_to_json(carbon_table, {})
+        if export is not None:
+            finish_sqlite_export(export, carbon_locations_data, spill.execute(
+                'SELECT pixel_number, reconfiguration_number FROM network_rows ORDER BY reconfiguration_number, rowid'
+            ))
+            export = None
+    except BaseException:
+        if export is not None:
+            discard_sqlite_export(export)
+        spill.close()
+        raise
+    
+    try:
+        (page_count,) = spill.execute('SELECT COUNT(*) FROM page_rows').fetchone()
+        remove_stale_pixel_pages(output_base_path, page_count)
+        for reconfiguration in carbon_locations_data["reconfigurations"]:
+            reconfiguration["network"] = StreamedArray(spilled_network(spill, reconfiguration["number"]))
+        write_json_chunked(f'{output_base_path}/assembly/assemblies.json', carbon_locations_data, output_format)
+        write_json_chunked(f'{output_base_path}/aggregates.json',
+                           spilled_aggregates(spill, rollup, network_numbers), output_format)
+        for relative_path, data in spilled_filter_index_files(spill, network_numbers):
+            write_json_chunked(f'{output_base_path}/{relative_path}', data, output_format)
+        write_json_chunked(f'{output_base_path}/routes.json',
+                           create_routes_from_table(routes, spilled_route_pixels(spill)), output_format)
+    finally:
+        spill.close()
+
+MANIFEST_VERSION = 2
+
+def index_carbon_rows(carbon_table):
+    """Map every reconfiguration number to its raw carbon_location.csv row"""
+    carbon_rows = {}
+    for row in carbon_table["rows"]:
+        reconfig_num = safe_int(safe_get(row, 'Reconfiguration number'))
+        if reconfig_num:
+            carbon_rows[reconfig_num] = row
+    return carbon_rows
+
+def pixel_row_inputs(row, carbon_rows, timeline_columns, generation_descriptions, state_legend):
+    """Every input that feeds the pixel of a master.csv row: the row, the carbon_location.csv
+    rows of the reconfigurations on its timeline, and its generation and state descriptions"""
+    generation = safe_int(safe_get(row, 'Generation'))
+    state = safe_int(safe_get(row, 'State'))
+    referenced = [
+        list(carbon_rows[num].items())
+        for num, column in timeline_columns.items()
+        if safe_get(row, column, '').strip() == '1' and num in carbon_rows
+    ]
+    return [
+        list(row.items()),
+        referenced,
+        generation_descriptions.get(generation),
+        state_legend.get(state)
+    ]
+
+def hash_pixel_inputs(row_inputs):
+    """Hash the serialized inputs of the master.csv rows of one pixel, exactly like hashing the JSON
+    list of their inputs, so rows serialized once can be reused"""
+    return hash_text('[' + ', '.join(row_inputs) + ']')
+
+def compute_pixel_input_hashes(master_table, carbon_table, generation_descriptions, state_legend):
+    """Hash every input that feeds a pixel file, over all of its master.csv rows"""
+    carbon_rows = index_carbon_rows(carbon_table)
+    timeline_columns = master_table["reconfiguration_columns"]["timeline"]
+
+    pixel_inputs = {}
+    for row in master_table["rows"]:
+        if not safe_get(row, 'Pixel number'):
+            continue
+        serial = f"{safe_int(safe_get(row, 'Pixel number')):04d}"
+        pixel_inputs.setdefault(serial, []).append(
+            json.dumps(pixel_row_inputs(row, carbon_rows, timeline_columns, generation_descriptions, state_legend)))
+
+    return {serial: hash_pixel_inputs(inputs) for serial, inputs in pixel_inputs.items()}
+
+def load_manifest(manifest_path, output_format='pretty'):
+    """Load the incremental build manifest, or an empty one if it is missing, outdated or
+    was written for another output format"""
+    empty = {"version": MANIFEST_VERSION, "format": output_format, "pixels": {}, "files": {}}
+    if not os.path.exists(manifest_path):
+        return empty
+    with open(manifest_path, 'r') as f:
+        manifest = json.load(f)
+    if manifest.get("version") != MANIFEST_VERSION or manifest.get("format", 'pretty') != output_format:
+        return empty
+    return manifest
+
+def select_changed_pixels(manifest, input_hashes, pixel_dir):
+    """Return the serials whose inputs changed since the last incremental build or whose file no
+    longer holds what it wrote (other builds don't update the manifest), and the manifest entries
+    of all other serials with the current stat of their file"""
+    changed = set()
+    unchanged = {}
+    for serial, input_hash in input_hashes.items():
+        previous = manifest["pixels"].get(serial)
+        if previous is not None and previous["input"] == input_hash:
+            current = verify_file(f'{pixel_dir}/pixel_{serial}.json', previous["output"], previous.get("stat"))
+            if current is not None:
+                unchanged[serial] = dict(previous, stat=current)
+                continue
+        changed.add(serial)
+    return changed, unchanged
+
+def find_stale_pixel_files(manifest, input_hashes, pixel_dir):
+    """Return the serials of pixel files on disk or in the manifest that no longer have a source row"""
+    stale = {serial for serial in manifest["pixels"] if serial not in input_hashes}
+    if os.path.isdir(pixel_dir):
+        for filename in os.listdir(pixel_dir):
+            match = re.fullmatch(r'pixel_(\d+)\.json', filename)
+            if match and match.group(1) not in input_hashes:
+                stale.add(match.group(1))
+    return stale
+
+def write_bank_incremental(output_base_path, manifest_path, outputs, master_data, timeline_data, input_hashes,
+                           workers=1, executor='thread', output_format='pretty'):
+    """Write only the bank files whose content changed, remove deleted pixels and save the manifest.
+    outputs holds the files of the whole-bank targets; the pixel files are built here, only for the
+    pixels whose inputs changed."""
+    pixel_dir = f'{output_base_path}/pixel'
+    manifest = load_manifest(manifest_path, output_format)
+    changed, pixels = select_changed_pixels(manifest, input_hashes, pixel_dir)
+    stale = find_stale_pixel_files(manifest, input_hashes, pixel_dir)
+    touched = []
+
+    # Aggregate files are cheap to build in memory, so only skip the write when the bytes on disk match
+    files = {}
+    for relative_path, data in outputs.items():
+        text = serialize_json(data, output_format)
+        digest = hash_text(text)
+        path = f'{output_base_path}/{relative_path}'
+        previous = manifest["files"].get(relative_path)
+        current = None
+        if previous is not None and previous["hash"] == digest:
+            current = verify_file(path, digest, previous["stat"])
+        if current is not None:
+            count_event('incremental_files_skipped')
+        else:
+            write_text_atomic(path, text)
+            touched.append(relative_path)
+            current = file_stat(path)
+        files[relative_path] = {"hash": digest, "stat": current}
+
+    pixel_files = create_individual_pixel_files(master_data, timeline_data, serials=changed)
+    jobs = [(f'{pixel_dir}/pixel_{serial}.json', pixel_data) for serial, pixel_data in pixel_files.items()]
+    digests = write_json_files(jobs, workers, executor, output_format)
+    for serial, digest in zip(pixel_files, digests):
+        pixels[serial] = {"input": input_hashes[serial], "output": digest,
+                          "stat": file_stat(f'{pixel_dir}/pixel_{serial}.json')}
+        touched.append(f'pixel/pixel_{serial}.json')
+
+    removed = []
+    for serial in sorted(stale):
+        path = f'{pixel_dir}/pixel_{serial}.json'
+        if os.path.exists(path):
+            os.remove(path)
+            removed.append(f'pixel/pixel_{serial}.json')
+    removed.extend(remove_stale_pixel_pages(output_base_path, len(outputs["pixels/index.json"]["pages"])))
+    count_event('incremental_pixel_files_skipped', len(input_hashes) - len(pixel_files))
+    count_event('files_removed', len(removed))
+
+    manifest = {"version": MANIFEST_VERSION, "format": output_format, "pixels": pixels, "files": files}
+    write_text_atomic(manifest_path, json.dumps(manifest, indent=2, sort_keys=True))
+
+    print(f"Incremental build: {len(touched)} files written, "
+          f"{len(input_hashes) - len(pixel_files)} pixel files unchanged, {len(removed)} removed")
+    for relative_path in touched:
+        print(f"  wrote   {relative_path}")
+    for relative_path in removed:
+        print(f"  removed {relative_path}")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Translate the CSV originals into the JSON data bank")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--incremental', action='store_true',
+                      help="only rewrite files whose source rows changed since the last build")
+    mode.add_argument('--stream', action='store_true',
+                      help="process master.csv row by row and spill what the index, aggregate and route "
+                           "files need to a temporary database, so memory does not grow with the pixel count")
+    mode.add_argument('--watch', action='store_true',
+                      help="keep running and rebuild the bank whenever a CSV original changes")
+    mode.add_argument('--target', action='append', type=parse_target,
+                      help="build only this part of the bank, skipping it if its inputs are unchanged: "
+                           "assemblies, pixels, indexes, aggregates, routes, sqlite or pixel:NNNN (repeatable); "
+                           "assemblies, pixels and pixel:NNNN also update their rows of the SQLite export")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="number of workers serializing and writing pixel files (default: 1)")
+    parser.add_argument('--executor', choices=['thread', 'process'], default='thread',
+                        help="run the writer workers as threads or processes (default: thread)")
+    parser.add_argument('--format', dest='output_format', choices=sorted(JSON_FORMATS), default='pretty',
+                        help="write indented (pretty) or minified (compact) JSON (default: pretty)")
+    parser.add_argument('--page-size', type=int, default=PIXEL_PAGE_SIZE,
+                        help=f"number of pixels per page in pixels/page_XXXX.json (default: {PIXEL_PAGE_SIZE})")
+    parser.add_argument('--precompress', action='store_true',
+                        help="write .gz and .br sidecars next to every file in the bank")
+    parser.add_argument('--hashed-assets', metavar='DIR',
+                        help="also place every asset under its content-hashed filename in DIR, for serving "
+                             "with immutable cache headers, and name those files in the asset manifest; files "
+                             f"only older manifests than the last {HASHED_VERSIONS_KEPT} name are removed")
+    parser.add_argument('--report', metavar='PATH',
+                        help="write a JSON build report (stage timings, rows read, files and bytes written, "
+                             "cache counters) to PATH, or to stdout with '-'")
+    parser.add_argument('--profile', choices=['cprofile', 'tracemalloc'],
+                        help="run the build under cProfile or tracemalloc and report the top hot spots")
+    parser.add_argument('--profile-top', type=int, default=20,
+                        help="number of hot spots to report with --profile (default: 20)")
+    parser.add_argument('--poll-interval', type=float, default=1.0,
+                        help="seconds between checks of the originals with --watch (default: 1.0)")
+    parser.add_argument('--debounce', type=float, default=0.5,
+                        help="seconds the originals must stay unchanged before --watch rebuilds (default: 0.5)")
+    args = parser.parse_args(argv)
+    if args.page_size < 1:
+        parser.error("--page-size must be at least 1")
+    if args.poll_interval <= 0 or args.debounce < 0:
+        parser.error("--poll-interval must be positive and --debounce must not be negative")
+    if args.watch and (args.report or args.profile):
+        parser.error("--watch cannot be combined with --report or --profile")
+    return args
+
+# Paths of the build, relative to the repository root it is run from
+BASE_PATH = 'public/data/originals'
+OUTPUT_BASE_PATH = 'public/data/bank'
+DATA_PATH = 'public/data'
+ASSET_MANIFEST_PATH = 'public/data/asset_manifest.json'
+# Build state, caches and the SQLite export stay out of public/, which is deployed as is
+CACHE_PATH = '.cache/bank'
+MANIFEST_PATH = '.cache/bank/manifest.json'
+TARGETS_STATE_PATH = '.cache/bank/targets.json'
+ASSET_HASHES_PATH = '.cache/bank/asset_hashes.json'
+SQLITE_PATH = '.cache/bank/bank.sqlite'
+
+def make_bank_dirs(output_base_path):
+    """Create the directories of the bank and of the build state if they don't exist"""
+    for directory in ('assembly', 'pixel', 'pixels', 'index'):
+        os.makedirs(f'{output_base_path}/{directory}', exist_ok=True)
+    os.makedirs(CACHE_PATH, exist_ok=True)
+
+def finish_bank(args, output_base_path=OUTPUT_BASE_PATH):
+    """Bring the sidecars and the asset manifest up to date with a freshly written bank"""
+    update_sidecars(output_base_path, args.precompress)
+    with instrument_stage('update_asset_manifest'):
+        update_asset_manifest(DATA_PATH, ASSET_MANIFEST_PATH, args.output_format, args.hashed_assets,
+                              ASSET_HASHES_PATH)
+
+def update_sidecars(output_base_path, precompress):
+    """Write the compressed sidecars, or remove the ones a previous --precompress build left behind"""
+    with instrument_stage('precompress' if precompress else 'remove_stale_sidecars'):
+        if precompress:
+            write_compressed_sidecars(output_base_path)
+        else:
+            remove_stale_sidecars(output_base_path)
+
+def write_bank(output_base_path, outputs, pixel_files, workers=1, executor='thread', output_format='pretty'):
+    """Write every file of the bank: the outputs of the whole-bank targets, then the pixel files"""
+    for relative_path, data in outputs.items():
+        write_json_atomic(f'{output_base_path}/{relative_path}', data, output_format)
+    remove_stale_pixel_pages(output_base_path, len(outputs["pixels/index.json"]["pages"]))
+
+    # Save individual pixel files; pixel_number is already formatted
+    jobs = [(f'{output_base_path}/pixel/pixel_{pixel_number}.json', pixel_data)
+            for pixel_number, pixel_data in pixel_files.items()]
+    write_json_files(jobs, workers, executor, output_format)
 
-def main():
-    # Update paths to match the new public folder structure
-    base_path = 'public/data/originals'
-    output_base_path = 'public/data/bank'
-    
-    generation_descriptions = load_generation_descriptions(f'{base_path}/generation_description.csv')
-    state_legend = load_state_legend(f'{base_path}/state_legend.csv')
-    reconfig_columns = load_reconfigurations(f'{base_path}/carbon_location.csv')
-    
-    # Pass master_csv to convert_carbon_locations_to_json
-    carbon_locations_data = convert_carbon_locations_to_json(f'{base_path}/carbon_location.csv', f'{base_path}/master.csv')
-    master_data = convert_master_to_json(f'{base_path}/master.csv', generation_descriptions, state_legend, reconfig_columns)
-    timeline_data = create_timeline_json(f'{base_path}/master.csv', f'{base_path}/carbon_location.csv')
-    
-    # Generate individual pixel files and simplified pixels.json
-    pixel_files = create_individual_pixel_files(master_data, timeline_data)
-    simplified_pixels = create_simplified_pixels_json(master_data, timeline_data)
-    
-    # Create directories if they don't exist
-    os.makedirs(f'{output_base_path}/assembly', exist_ok=True)
-    os.makedirs(f'{output_base_path}/pixel', exist_ok=True)
-    
-    # Save assemblies.json (renamed from carbon_locations.json)
-    with open(f'{output_base_path}/assembly/assemblies.json', 'w') as f:
-        json.dump(carbon_locations_data, f, indent=2)
-    
-    # Save simplified pixels.json
-    with open(f'{output_base_path}/pixel/pixels.json', 'w') as f:
-        json.dump(simplified_pixels, f, indent=2)
-
-    # Save individual pixel files
-    for pixel_number, pixel_data in pixel_files.items():
-        filename = f'pixel_{pixel_number}.json'  # pixel_number is already formatted
-        with open(f'{output_base_path}/pixel/{filename}', 'w') as f:
-            json.dump(pixel_data, f, indent=2)
+# The build as a graph of named stages. Every stage declares its inputs, which are either originals
+# or other stages, and computes its result from the results of those inputs.
+BUILD_STAGES = {
+    'generation_descriptions': {
+        'inputs': ['generation_description.csv'],
+        'run': lambda base_path, results: load_generation_descriptions(f'{base_path}/generation_description.csv')
+    },
+    'state_legend': {
+        'inputs': ['state_legend.csv'],
+        'run': lambda base_path, results: load_state_legend(f'{base_path}/state_legend.csv')
+    },
+    'master_table': {
+        'inputs': ['master.csv'],
+        'run': lambda base_path, results: load_master_table(f'{base_path}/master.csv')
+    },
+    'carbon_table': {
+        'inputs': ['carbon_location.csv'],
+        'run': lambda base_path, results: load_csv_table(f'{base_path}/carbon_location.csv')
+    },
+    'pixel_networks': {
+        'inputs': ['master_table'],
+        'run': lambda base_path, results: extract_reconfiguration_networks(results['master_table'])
+    },
+    'carbon_locations': {
+        'inputs': ['carbon_table', 'pixel_networks'],
+        'run': lambda base_path, results: convert_carbon_locations_to_json(results['carbon_table'],
+                                                                           results['pixel_networks'])
+    },
+    'master_data': {
+        'inputs': ['master_table', 'generation_descriptions', 'state_legend'],
+        'run': lambda base_path, results: convert_master_to_json(results['master_table'],
+                                                                 results['generation_descriptions'],
+                                                                 results['state_legend'])
+    },
+    'timeline_data': {
+        'inputs': ['master_table', 'carbon_table'],
+        'run': lambda base_path, results: create_timeline_json(results['master_table'], results['carbon_table'])
+    },
+    'simplified_pixels': {
+        'inputs': ['master_data', 'timeline_data'],
+        'run': lambda base_path, results: create_simplified_pixels_json(results['master_data'],
+                                                                        results['timeline_data'])
+    },
+    'aggregates': {
+        'inputs': ['master_data', 'timeline_data', 'pixel_networks'],
+        'run': lambda base_path, results: create_aggregates(
+            pixel_records(results['master_data'], results['timeline_data']), results['pixel_networks'])
+    },
+    'routes': {
+        'inputs': ['timeline_data'],
+        'run': lambda base_path, results: create_routes(results['timeline_data'])
+    },
+    'input_hashes': {
+        'inputs': ['master_table', 'carbon_table', 'generation_descriptions', 'state_legend'],
+        'run': lambda base_path, results: compute_pixel_input_hashes(results['master_table'], results['carbon_table'],
+                                                                     results['generation_descriptions'],
+                                                                     results['state_legend'])
+    }
+}
+
+class TargetError(Exception):
+    """A target that cannot be built from the originals"""
+
+def pixel_target_record(results, serial):
+    """The (pixel, timeline) record of a single pixel, converting only its own master.csv rows"""
+    master_table = results['master_table']
+    exact_columns = master_table["reconfiguration_columns"]["exact"]
+    timeline_columns = master_table["reconfiguration_columns"]["timeline"]
+    carbon_data = build_carbon_lookup(results['carbon_table'])
+    
+    # Like create_individual_pixel_files, the last row of a pixel number wins, with its own timeline
+    pixel = None
+    pixel_timeline = None
+    for row in master_table["rows"]:
+        if not safe_get(row, 'Pixel number') or f"{safe_int(safe_get(row, 'Pixel number')):04d}" != serial:
+            continue
+        pixel = convert_master_row(row, exact_columns, results['generation_descriptions'], results['state_legend'])
+        pixel_timeline = create_pixel_timeline(row, timeline_columns, carbon_data)
+    if pixel is None:
+        raise TargetError(f"pixel {serial} is not in master.csv")
+    return pixel, pixel_timeline
+
+def pixel_target_outputs(results, serial, options):
+    """The pixel_XXXX.json file of a single pixel"""
+    return {f'pixel/pixel_{serial}.json': create_pixel_file(*pixel_target_record(results, serial))}
+
+def pixels_target_outputs(results, options):
+    simplified_pixels = results['simplified_pixels']
+    outputs = {'pixel/pixels.json': simplified_pixels}
+    outputs.update(create_pixel_pages(simplified_pixels, options['page_size']))
+    return outputs
+
+# Targets that can be built on their own, with the stages they need, the bank files they write and
+# how they update the rows they own in an existing SQLite export
+BUILD_TARGETS = {
+    'assemblies': {
+        'stages': ['carbon_locations'],
+        'outputs': lambda results, options: {'assembly/assemblies.json': results['carbon_locations']},
+        'export': lambda connection, results, serial: replace_reconfigurations(
+            connection, results['carbon_locations'], network_memberships(results['pixel_networks']))
+    },
+    'pixels': {
+        'stages': ['simplified_pixels'],
+        'outputs': pixels_target_outputs,
+        'export': lambda connection, results, serial: replace_pixel_records(
+            connection, pixel_records(results['master_data'], results['timeline_data']))
+    },
+    'indexes': {
+        'stages': ['simplified_pixels', 'pixel_networks'],
+        'outputs': lambda results, options: create_filter_indexes(results['simplified_pixels'],
+                                                                  results['pixel_networks']),
+        'export': None
+    },
+    'aggregates': {
+        'stages': ['aggregates'],
+        'outputs': lambda results, options: {'aggregates.json': results['aggregates']},
+        'export': None
+    },
+    'routes': {
+        'stages': ['routes'],
+        'outputs': lambda results, options: {'routes.json': results['routes']},
+        'export': None
+    },
+    'pixel': {
+        'stages': ['master_table', 'carbon_table', 'generation_descriptions', 'state_legend'],
+        'outputs': None,  # built per serial by pixel_target_outputs
+        'export': lambda connection, results, serial: insert_pixel_record(
+            connection, *pixel_target_record(results, serial))
+    },
+    'sqlite': {
+        'stages': ['master_data', 'timeline_data', 'carbon_locations', 'pixel_networks'],
+        'outputs': None,  # exported in full by write_sqlite
+        'export': None
+    }
+}
+
+# The targets that make up the whole bank besides the pixel files, which the full build writes all of
+BANK_TARGETS = ('assemblies', 'pixels', 'indexes', 'aggregates', 'routes')
+
+TARGETS_VERSION = 2
+
+def parse_target(value):
+    """Check a --target value and normalize pixel:42 to pixel:0042"""
+    name, _, serial = value.partition(':')
+    if name not in BUILD_TARGETS or (name == 'pixel') != bool(serial):
+        raise argparse.ArgumentTypeError(
+            f"unknown target {value!r} (choose from {', '.join(sorted(set(BUILD_TARGETS) - {'pixel'}))} "
+            f"or pixel:NNNN)")
+    if serial:
+        if not serial.isdigit():
+            raise argparse.ArgumentTypeError(f"invalid pixel number in target {value!r}")
+        return f"pixel:{int(serial):04d}"
+    return name
+
+def stage_order(stages):
+    """The given stages and everything they depend on, each after its inputs"""
+    order = []
+    def visit(name):
+        if name in order:
+            return
+        for dependency in BUILD_STAGES[name]['inputs']:
+            if dependency in BUILD_STAGES:
+                visit(dependency)
+        order.append(name)
+    for name in stages:
+        visit(name)
+    return order
+
+def stage_originals(stages):
+    """The originals the given stages read, directly or through the stages they depend on"""
+    return sorted({
+        dependency
+        for name in stage_order(stages)
+        for dependency in BUILD_STAGES[name]['inputs']
+        if dependency not in BUILD_STAGES
+    })
+
+def run_stages(stages, base_path=BASE_PATH, results=None):
+    """Run the given stages and everything they depend on, returning the result of every stage.
+    Stages already in results are not run again."""
+    results = dict(results or {})
+    for stage in stage_order(stages):
+        if stage in results:
+            continue
+        with instrument_stage(stage):
+            results[stage] = BUILD_STAGES[stage]['run'](base_path, results)
+    return results
+
+def target_options(args):
+    """The command line options that change the bytes of the target files"""
+    return {"output_format": args.output_format, "page_size": args.page_size}
+
+def bank_outputs(results, options, targets=BANK_TARGETS):
+    """The files of the given targets, relative to the bank, from the results of their stages"""
+    outputs = {}
+    for name in targets:
+        outputs.update(BUILD_TARGETS[name]['outputs'](results, options))
+    return outputs
+
+def load_targets_state(path):
+    """Load the input hashes and written files of the targets built so far, or an empty state if
+    missing or outdated"""
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            state = json.load(f)
+        if state.get("version") == TARGETS_VERSION:
+            return state
+    return {"version": TARGETS_VERSION, "targets": {}}
+
+def build_targets(targets, options, base_path=BASE_PATH, output_base_path=OUTPUT_BASE_PATH,
+                  state_path=TARGETS_STATE_PATH, sqlite_path=SQLITE_PATH):
+    """Run only the stages the targets need and write only their files, skipping every target whose
+    originals and options are unchanged since it was last built and whose files still hold what it
+    wrote (other builds rewrite them without updating the state)"""
+    state = load_targets_state(state_path)
+    state_changed = False
+    file_hashes = {}
+    pending = {}
+    for target in targets:
+        name = target.partition(':')[0]
+        originals = stage_originals(BUILD_TARGETS[name]['stages'])
+        for original in originals:
+            if original not in file_hashes:
+                file_hashes[original] = hash_file(f'{base_path}/{original}')
+        input_hash = hash_text(json.dumps([[file_hashes[original] for original in originals], options],
+                                          sort_keys=True))
+        previous = state["targets"].get(target)
+        if previous is not None and previous["inputs"] == input_hash:
+            files = {}
+            for relative_path, entry in previous["files"].items():
+                current = verify_file(f'{output_base_path}/{relative_path}', entry["hash"], entry["stat"])
+                if current is None:
+                    break
+                files[relative_path] = {"hash": entry["hash"], "stat": current}
+            else:
+                count_event('targets_skipped')
+                print(f"{target}: up to date")
+                if files != previous["files"]:
+                    previous["files"] = files
+                    state_changed = True
+                continue
+        pending[target] = input_hash
+    
+    stages = [stage for target in pending for stage in BUILD_TARGETS[target.partition(':')[0]]['stages']]
+    results = run_stages(stages, base_path)
+    
+    # Build the files of every target before writing any, so a target that cannot be built leaves
+    # the bank untouched
+    target_outputs = {}
+    for target in pending:
+        name, _, serial = target.partition(':')
+        if serial:
+            target_outputs[target] = pixel_target_outputs(results, serial, options)
+        elif name != 'sqlite':
+            target_outputs[target] = bank_outputs(results, options, [name])
+    
+    make_bank_dirs(output_base_path)
+    for target, input_hash in pending.items():
+        if target == 'sqlite':
+            with instrument_stage('target sqlite'):
+                write_sqlite(sqlite_path, pixel_records(results['master_data'], results['timeline_data']),
+                             results['carbon_locations'], results['pixel_networks'])
+            # Recorded relative to the bank like the other target files
+            files = {os.path.relpath(sqlite_path, output_base_path): {"hash": hash_file(sqlite_path),
+                                                                      "stat": file_stat(sqlite_path)}}
+            state["targets"][target] = {"inputs": input_hash, "files": files}
+            state_changed = True
+            print(f"{target}: exported {sqlite_path}")
+            continue
+        name = target.partition(':')[0]
+        outputs = target_outputs[target]
+        files = {}
+        with instrument_stage(f'target {target}'):
+            for relative_path, data in outputs.items():
+                path = f'{output_base_path}/{relative_path}'
+                files[relative_path] = {
+                    "hash": write_json_atomic(path, data, options['output_format']),
+                    "stat": file_stat(path)
+                }
+            if name == 'pixels':
+                remove_stale_pixel_pages(output_base_path, len(outputs["pixels/index.json"]["pages"]))
+        state["targets"][target] = {"inputs": input_hash, "files": files}
+        state_changed = True
+        print(f"{target}: wrote {len(outputs)} files")
+    
+    # The full export already holds everything; otherwise every built target rewrites its own rows
+    exports = [target for target in pending if BUILD_TARGETS[target.partition(':')[0]]['export'] is not None]
+    if exports and 'sqlite' not in pending:
+        if os.path.exists(sqlite_path):
+            with instrument_stage('update_sqlite_export'):
+                update_sqlite_export(sqlite_path, [
+                    partial(BUILD_TARGETS[target.partition(':')[0]]['export'], results=results,
+                            serial=target.partition(':')[2])
+                    for target in exports
+                ])
+            print(f"{sqlite_path}: updated the rows of {', '.join(exports)}")
+        else:
+            print(f"{sqlite_path}: no export to update yet (run a full build or --target sqlite)")
+    
+    if state_changed:
+        write_text_atomic(state_path, json.dumps(state, indent=2, sort_keys=True))
+
+def build_bank(args, base_path=BASE_PATH, output_base_path=OUTPUT_BASE_PATH, manifest_path=MANIFEST_PATH,
+               sqlite_path=SQLITE_PATH, results=None, sqlite_changes=None):
+    """Build every target through the stage graph and write the whole bank and its SQLite export, in
+    full or, with --incremental or --watch, only the files whose content changed. Stages already in
+    results (like the warm ones of the watch mode) are not run again. With sqlite_changes, the pixel
+    numbers whose records changed and whether the reconfigurations did, the existing export is
+    updated in place instead of exported again."""
+    incremental = args.incremental or args.watch
+    stages = [stage for name in BANK_TARGETS for stage in BUILD_TARGETS[name]['stages']]
+    stages += ['master_data', 'timeline_data'] + (['input_hashes'] if incremental else [])
+    results = run_stages(stages, base_path, results)
+    outputs = bank_outputs(results, target_options(args))
+    
+    make_bank_dirs(output_base_path)
+    if incremental:
+        with instrument_stage('write_bank_incremental'):
+            write_bank_incremental(output_base_path, manifest_path, outputs, results['master_data'],
+                                   results['timeline_data'], results['input_hashes'], args.workers,
+                                   args.executor, args.output_format)
+    else:
+        # Generate individual pixel files
+        with instrument_stage('create_individual_pixel_files'):
+            pixel_files = create_individual_pixel_files(results['master_data'], results['timeline_data'])
+        with instrument_stage('write_bank'):
+            write_bank(output_base_path, outputs, pixel_files, args.workers, args.executor, args.output_format)
+    
+    if sqlite_changes is None:
+        with instrument_stage('write_sqlite'):
+            write_sqlite(sqlite_path, pixel_records(results['master_data'], results['timeline_data']),
+                         results['carbon_locations'], results['pixel_networks'])
+        return results
+    updates = [partial(replace_pixels, records=pixel_records(results['master_data'], results['timeline_data']),
+                       pixel_numbers=sqlite_changes["pixel_numbers"])]
+    if sqlite_changes["reconfigurations"]:
+        updates.append(partial(replace_reconfigurations, carbon_locations_data=results['carbon_locations'],
+                               memberships=network_memberships(results['pixel_networks'])))
+    with instrument_stage('update_sqlite_export'):
+        update_sqlite_export(sqlite_path, updates)
+    return results
+
+def run_build(args):
+    """Run the whole build for parsed command line arguments"""
+    base_path = BASE_PATH
+    output_base_path = OUTPUT_BASE_PATH
+    manifest_path = MANIFEST_PATH
+    
+    if args.target:
+        try:
+            build_targets(args.target, target_options(args), base_path, output_base_path)
+        except TargetError as error:
+            sys.exit(f"{os.path.basename(sys.argv[0])}: error: {error}")
+        finish_bank(args, output_base_path)
+        return
+    
+    make_bank_dirs(output_base_path)
+    
+    report_sizes = args.precompress or args.output_format != 'pretty'
+    sizes_before = snapshot_sizes(output_base_path) if report_sizes else None
+    
+    if args.stream:
+        # The streaming build reads master.csv row by row instead of running the table stages
+        results = run_stages(['generation_descriptions', 'state_legend'], base_path)
+        with instrument_stage('write_bank_streaming'):
+            write_bank_streaming(base_path, output_base_path, results['generation_descriptions'],
+                                 results['state_legend'], args.output_format, args.page_size, SQLITE_PATH)
+    else:
+        build_bank(args, base_path, output_base_path, manifest_path)
             
     # Don't save the original master.json and timeline.json anymore
     # as they've been replaced with the new files
+    
+    finish_bank(args, output_base_path)
+    if report_sizes:
+        print_size_report(sizes_before, output_base_path)
+
+# Loader of every original the watch mode keeps parsed in memory
+WATCHED_FILES = {
+    'generation_description.csv': load_generation_descriptions,
+    'state_legend.csv': load_state_legend,
+    'master.csv': load_master_table,
+    'carbon_location.csv': load_csv_table
+}
+
+def snapshot_originals(base_path):
+    """The modification time and size of every watched original that exists"""
+    snapshot = {}
+    for filename in WATCHED_FILES:
+        try:
+            stat = os.stat(f'{base_path}/{filename}')
+        except FileNotFoundError:
+            continue
+        snapshot[filename] = (stat.st_mtime_ns, stat.st_size)
+    return snapshot
+
+# The caches of the watch mode, by the originals besides master.csv whose change invalidates them.
+# A carbon_location.csv change only invalidates the timelines and inputs of the rows that reference
+# one of the reconfigurations whose row changed.
+WARM_CACHES = {
+    'pixels': ('generation_description.csv', 'state_legend.csv'),
+    'timelines': (),
+    'inputs': ('generation_description.csv', 'state_legend.csv')
+}
+
+def new_watch_state():
+    """Warm state of the watch mode: the parsed originals with the snapshot they were loaded at, the
+    results of every stage of the last rebuild, and per master.csv row, keyed by its raw cells, its
+    pixel, its timeline and its serialized inputs"""
+    return {"tables": {}, "snapshot": {}, "results": {}, "pixels": {}, "timelines": {}, "inputs": {}}
+
+def changed_reconfigurations(old_carbon_table, carbon_table):
+    """The reconfiguration numbers whose carbon_location.csv row was added, removed or edited"""
+    old_rows = index_carbon_rows(old_carbon_table)
+    rows = index_carbon_rows(carbon_table)
+    return {number for number in old_rows.keys() | rows.keys() if old_rows.get(number) != rows.get(number)}
+
+def reuse_unchanged_stages(previous, results, unchanged):
+    """Add to results every stage of the previous rebuild whose inputs are all unchanged, so only the
+    stages downstream of what actually changed run again"""
+    for stage in stage_order(BUILD_STAGES):
+        if stage in results or stage not in previous:
+            continue
+        if all(dependency in unchanged for dependency in BUILD_STAGES[stage]['inputs']):
+            results[stage] = previous[stage]
+            unchanged.add(stage)
+
+def same_records(previous, records):
+    return previous is not None and len(previous) == len(records) and all(map(is_, previous, records))
+
+def row_key(row):
+    """The raw cells of a master.csv row as a hashable key; cells beyond the header arrive as a list"""
+    return tuple((column, tuple(value) if isinstance(value, list) else value) for column, value in row.items())
+
+def rebuild_warm(state, changed, args, base_path=BASE_PATH, output_base_path=OUTPUT_BASE_PATH,
+                 manifest_path=MANIFEST_PATH, sqlite_path=SQLITE_PATH):
+    """Reparse the changed originals, re-derive the pixels whose inputs changed and write the
+    bank incrementally, rerunning only the stages whose inputs changed and updating only the rows
+    of the SQLite export whose pixels changed. The state is only updated once the whole rebuild
+    succeeded. Returns the number of re-derived pixel records and the total."""
+    tables = dict(state["tables"])
+    for filename in changed:
+        with instrument_stage(f'load {filename}'):
+            tables[filename] = WATCHED_FILES[filename](f'{base_path}/{filename}')
+    missing = [filename for filename in WATCHED_FILES if filename not in tables]
+    if missing:
+        raise FileNotFoundError(f"missing {', '.join(missing)} in {base_path}")
+    generation_descriptions = tables['generation_description.csv']
+    state_legend = tables['state_legend.csv']
+    master_table = tables['master.csv']
+    carbon_table = tables['carbon_location.csv']
+
+    carbon_rows = index_carbon_rows(carbon_table)
+    carbon_data = build_carbon_lookup(carbon_table)
+    exact_columns = master_table["reconfiguration_columns"]["exact"]
+    timeline_columns = master_table["reconfiguration_columns"]["timeline"]
+
+    # Reuse whatever was derived from an unchanged row, unless the original it also depends on changed
+    previous = {
+        name: {} if set(dependencies) & set(changed) else state[name]
+        for name, dependencies in WARM_CACHES.items()
+    }
+    stale_reconfigurations = set()
+    if 'carbon_location.csv' in changed and 'carbon_location.csv' in state["tables"]:
+        stale_reconfigurations = changed_reconfigurations(state["tables"]['carbon_location.csv'], carbon_table)
+    caches = {name: {} for name in WARM_CACHES}
+    pixel_inputs = {}
+    pixels = []
+    timelines = []
+    timeline_rows = []
+    derived = 0
+    for row in master_table["rows"]:
+        if not safe_get(row, 'Pixel number'):
+            continue
+        key = row_key(row)
+        stale = bool(stale_reconfigurations) and any(
+            safe_get(row, column, '').strip() == '1'
+            for num, column in timeline_columns.items() if num in stale_reconfigurations)
+        if key not in previous["pixels"] or key not in previous["timelines"] or stale:
+            derived += 1
+        pixel = previous["pixels"].get(key)
+        if pixel is None:
+            pixel = convert_master_row(row, exact_columns, generation_descriptions, state_legend)
+        if key in previous["timelines"] and not stale:
+            pixel_timeline = previous["timelines"][key]
+        else:
+            pixel_timeline = create_pixel_timeline(row, timeline_columns, carbon_data)
+        inputs = None if stale else previous["inputs"].get(key)
+        if inputs is None:
+            inputs = json.dumps(pixel_row_inputs(row, carbon_rows, timeline_columns, generation_descriptions,
+                                                 state_legend))
+        caches["pixels"][key] = pixel
+        caches["timelines"][key] = pixel_timeline
+        caches["inputs"][key] = inputs
+        pixels.append(pixel)
+        timeline_rows.append(pixel_timeline)
+        if pixel_timeline is not None:
+            timelines.append(pixel_timeline)
+        pixel_inputs.setdefault(f"{pixel.pixel_number:04d}", []).append(inputs)
+    input_hashes = {serial: hash_pixel_inputs(inputs) for serial, inputs in pixel_inputs.items()}
+
+    # Every other stage runs off the warm tables and records, or is reused if none of its inputs changed
+    previous_results = state["results"]
+    results = {
+        'generation_descriptions': generation_descriptions,
+        'state_legend': state_legend,
+        'master_table': master_table,
+        'carbon_table': carbon_table,
+        'master_data': {"pixels": pixels},
+        'timeline_data': {"pixels": timelines, "rows": timeline_rows},
+        'input_hashes': input_hashes
+    }
+    unchanged = {stage for stage in ('generation_descriptions', 'state_legend', 'master_table', 'carbon_table')
+                 if stage in previous_results and BUILD_STAGES[stage]['inputs'][0] not in changed}
+    if same_records(previous_results.get('master_data', {}).get("pixels"), pixels):
+        results['master_data'] = previous_results['master_data']
+        unchanged.add('master_data')
+    if same_records(previous_results.get('timeline_data', {}).get("rows"), timeline_rows):
+        results['timeline_data'] = previous_results['timeline_data']
+        unchanged.add('timeline_data')
+    reuse_unchanged_stages(previous_results, results, unchanged)
+
+    # The first rebuild exports everything; later ones replace the rows of the pixels whose inputs changed
+    sqlite_changes = None
+    previous_hashes = previous_results.get('input_hashes')
+    if previous_hashes is not None and os.path.exists(sqlite_path):
+        sqlite_changes = {
+            "pixel_numbers": {int(serial) for serial in previous_hashes.keys() | input_hashes.keys()
+                              if previous_hashes.get(serial) != input_hashes.get(serial)},
+            "reconfigurations": not {'carbon_location.csv', 'master.csv'}.isdisjoint(changed)
+        }
+    results = build_bank(args, base_path, output_base_path, manifest_path, sqlite_path, results, sqlite_changes)
+    finish_bank(args, output_base_path)
+
+    state["tables"] = tables
+    state["results"] = results
+    state.update(caches)
+    return derived, len(pixels)
+
+def wait_until_settled(base_path, snapshot, debounce):
+    """Wait until the originals stop changing for the debounce period and return their snapshot"""
+    while True:
+        time.sleep(debounce)
+        settled = snapshot_originals(base_path)
+        if settled == snapshot:
+            return settled
+        snapshot = settled
+
+def watch_bank(args, base_path=BASE_PATH):
+    """Build the bank, then rebuild it from warm state every time an original changes"""
+    state = new_watch_state()
+    seen = snapshot_originals(base_path)
+    detected = time.perf_counter()
+    print(f"Watching {base_path} for changes (Ctrl+C to stop)")
+    while True:
+        pending = sorted(filename for filename in seen if seen[filename] != state["snapshot"].get(filename))
+        if pending:
+            started = time.perf_counter()
+            try:
+                derived, total = rebuild_warm(state, pending, args, base_path)
+            except Exception as error:
+                # Editors can save half written files; keep the last good state and wait for the next save
+                print(f"[{datetime.now():%H:%M:%S}] Rebuild after changes to {', '.join(pending)} "
+                      f"failed: {error!r}", file=sys.stderr)
+            else:
+                state["snapshot"].update((filename, seen[filename]) for filename in pending)
+                finished = time.perf_counter()
+                print(f"[{datetime.now():%H:%M:%S}] Rebuilt after changes to {', '.join(pending)}: "
+                      f"{derived} of {total} pixels re-derived in {finished - started:.3f}s, "
+                      f"{finished - detected:.3f}s after the change was detected")
+
+        current = seen
+        while current == seen:
+            time.sleep(args.poll_interval)
+            current = snapshot_originals(base_path)
+        detected = time.perf_counter()
+        seen = wait_until_settled(base_path, current, args.debounce)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.watch:
+        try:
+            watch_bank(args)
+        except KeyboardInterrupt:
+            print("Stopped watching")
+        return
+    if not args.report and not args.profile:
+        run_build(args)
+        return
+    
+    start_instrumentation()
+    date_cache_before = parse_timeline_date.cache_info()
+    started = datetime.now().isoformat(timespec='seconds')
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    profiler = None
+    # Keep stdout clean for the JSON report when it is written there
+    output = redirect_stdout(sys.stderr) if args.report == '-' else nullcontext()
+    try:
+        with output:
+            if args.profile == 'cprofile':
+                profiler = cProfile.Profile()
+                profiler.runcall(run_build, args)
+            elif args.profile == 'tracemalloc':
+                tracemalloc.start()
+                run_build(args)
+            else:
+                run_build(args)
+        
+        report = stop_instrumentation()
+        report = {
+            "started": started,
+            "options": {key: value for key, value in vars(args).items() if key not in ('report', 'profile_top')},
+            "wall_seconds": round(time.perf_counter() - wall_start, 6),
+            "cpu_seconds": round(time.process_time() - cpu_start, 6),
+            **report
+        }
+        date_cache = parse_timeline_date.cache_info()
+        report["counters"]["timeline_date_cache_hits"] = date_cache.hits - date_cache_before.hits
+        report["counters"]["timeline_date_cache_misses"] = date_cache.misses - date_cache_before.misses
+        if profiler is not None:
+            report["hot_spots"] = profile_hot_spots(profiler, args.profile_top)
+        elif args.profile == 'tracemalloc':
+            report["peak_traced_bytes"] = tracemalloc.get_traced_memory()[1]
+            report["hot_spots"] = allocation_hot_spots(tracemalloc.take_snapshot(), args.profile_top)
+    finally:
+        stop_instrumentation()
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+    
+    if args.report == '-':
+        json.dump(report, sys.stdout, indent=2)
+        print()
+        return
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2)
+    for hot_spot in report.get("hot_spots", []):
+        print("  " + "  ".join(f"{key}={value}" for key, value in hot_spot.items()))
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
\ No newline at end of file